@@ -0,0 +1,230 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import networkx as nx
+import numpy as np
+import jaccard_recs as jr
+
+
+def synthetic_user_dict(num_edges, alpha=2.1, seed=123):
+    """Generate a user_dict shaped like the scraped Steepster data.
+
+    Out-degrees follow a power law (most users follow fewer than 10 people,
+    see images/out_degree_distribution.png), and popular users are more
+    likely to be followed, which gives in-degrees a heavy tail as well.
+
+    Parameters
+    ----------
+    num_edges : int
+        Number of follow edges
+
+    alpha : float
+        Power-law exponent for out-degrees. Default value: 2.1
+
+    seed : int
+        Random seed. Default value: 123
+
+    Returns
+    -------
+    user_dict : dict
+        Dictionary with users as keys and 'follower_count', 'follower_pgs' and
+        'followers' subkeys, same as UserDict builds
+    """
+
+    rng = np.random.default_rng(seed)
+    # Pareto out-degrees have mean about (alpha-1)/(alpha-2)
+    mean_degree = (alpha - 1) / (alpha - 2)
+    num_users = max(10, int(num_edges / mean_degree))
+    out_degrees = np.minimum(rng.pareto(alpha - 1, num_users) + 1,
+                             num_users - 1).astype(np.int64)
+    out_degrees = np.maximum(1, np.round(out_degrees * num_edges
+                                         / out_degrees.sum())).astype(np.int64)
+
+    popularity = 1 / np.arange(1, num_users + 1)
+    popularity /= popularity.sum()
+    names = [f'user{i}' for i in range(num_users)]
+
+    # Draw edges until there are enough distinct, non-self ones
+    n = np.int64(num_users)
+    codes = np.zeros(0, dtype=np.int64)
+    src_weights = out_degrees / out_degrees.sum()
+    while len(codes) < num_edges:
+        missing = num_edges - len(codes)
+        if len(codes) == 0:
+            src = np.repeat(np.arange(num_users), out_degrees)
+        else:
+            src = rng.choice(num_users, size=int(missing * 1.2) + 10,
+                             p=src_weights)
+        dst = rng.choice(num_users, size=len(src), p=popularity)
+        new_codes = src[src != dst] * n + dst[src != dst]
+        codes = np.unique(np.concatenate([codes, new_codes]))
+    codes = rng.permutation(codes)[:num_edges]
+    src, dst = np.divmod(np.sort(codes), n)
+
+    followers = [[] for _ in range(num_users)]
+    for follower, user in zip(src.tolist(), dst.tolist()):
+        followers[user].append(names[follower])
+
+    user_dict = {}
+    for i, name in enumerate(names):
+        user_dict[name] = {
+            'follower_count': len(followers[i]),
+            'follower_pgs': int(math.ceil(len(followers[i]) / 10.0)),
+            'followers': followers[i],
+        }
+    return user_dict
+
+
+def _timed(stages, name, func, *args, items=None, **kwargs):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - start_bytes if tracing else None
+    count = items(result) if items is not None else None
+    stages[name] = {'seconds': seconds, 'peak_bytes': peak, 'items': count}
+    return result
+
+
+def run_pipeline(user_dict, n=100, k=50, H_threshold=1, seed=123):
+    """Time each stage of the notebook pipeline on one user_dict
+
+    Parameters
+    ----------
+    user_dict : dict
+        Dictionary of users and their followers
+
+    n : int
+        Number of users sampled for scoring and evaluation. Default value: 100
+
+    k : int
+        Number of recommendations. Default value: 50
+
+    H_threshold : int
+        Minimum out-degree for evaluation. Default value: 1
+
+    seed : int
+        Random seed. Default value: 123
+
+    Returns
+    -------
+    stages : dict
+        Stage name as key and a dict with 'seconds', 'peak_bytes' (traced
+        Python and NumPy allocations above the start of the stage) and
+        'items' as value. peak_bytes is None unless tracemalloc is running.
+    """
+
+    stages = {}
+    edges = _timed(stages, 'edgelist', jr.edgelist_from_user_dict, user_dict,
+                   items=len)
+    random.seed(seed)
+    train, test = _timed(stages, 'split', jr.train_test_split_edgelist,
+                         list(edges), items=lambda r: len(r[0]))
+    G = _timed(stages, 'graph', nx.DiGraph, train,
+               items=lambda g: g.number_of_nodes())
+    users = jr.get_random_node_sample(G, n=min(n, G.number_of_nodes()),
+                                      seed=seed)
+    coefs = _timed(stages, 'scoring',
+                   lambda: list(jr.jaccard_coefficient(
+                       G, ebunch=jr.two_hop_ebunch(G, users))),
+                   items=len)
+    _timed(stages, 'top_k', jr.recommend_top_k, G, users=users, k=k,
+           items=len)
+    _timed(stages, 'precision_at_k', jr.calculate_precision_at_k, G, coefs,
+           test, edges, H_threshold, n=len(users), k=k, seed=seed,
+           items=lambda r: len(r[0]))
+    return stages
+
+
+def run_benchmarks(sizes=(1000, 10000, 100000, 1000000), n=100, k=50,
+                   seed=123, trace_memory=True):
+    """Run the pipeline on synthetic graphs of several sizes
+
+    Parameters
+    ----------
+    sizes : iterable of int
+        Target number of edges for each graph.
+        Default value: (1000, 10000, 100000, 1000000)
+
+    n : int
+        Number of users sampled for scoring and evaluation. Default value: 100
+
+    k : int
+        Number of recommendations. Default value: 50
+
+    seed : int
+        Random seed. Default value: 123
+
+    trace_memory : bool
+        Measure peak memory with tracemalloc. Tracing slows down pure Python
+        stages, so turn it off when only wall time matters.
+        Default value: True
+
+    Returns
+    -------
+    report : dict
+        'meta' with the environment and settings, and 'runs' with one entry
+        per size holding the graph size and the stage timings
+    """
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'networkx': nx.__version__,
+            'numpy': np.__version__,
+            'n': n, 'k': k, 'seed': seed, 'trace_memory': trace_memory,
+        },
+        'runs': [],
+    }
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for size in sizes:
+            user_dict = synthetic_user_dict(size, seed=seed)
+            stages = run_pipeline(user_dict, n=n, k=k, seed=seed)
+            report['runs'].append({
+                'target_edges': size,
+                'users': len(user_dict),
+                'edges': stages['edgelist']['items'],
+                'stages': stages,
+            })
+            del user_dict
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the follow recommender on synthetic graphs')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--n', type=int, default=100)
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc for more accurate timings')
+    parser.add_argument('--output', help='JSON file to write (default stdout)')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, n=args.n, k=args.k, seed=args.seed,
+                            trace_memory=not args.no_memory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,210 @@
+import glob
+import os
+import numpy as np
+from compact_graph import top_k_jaccard
+from instrumentation import instrumented, stage
+from rec_store import load_strings, save_array, save_strings
+
+# Bytes held per nonzero of A[rows]·Aᵀ while a chunk is scored: index and
+# value arrays of the product plus scipy's temporaries, with some headroom
+_BYTES_PER_SHARED = 24
+# Bytes held per recommendation slot: top_k_jaccard's int32 rec_ids and
+# float64 rec_scores, plus the float32 copy of the scores that is saved
+_BYTES_PER_REC = 16
+# Bytes held per user whatever their degree: the row index and the indptr
+# entries of A[rows] and of the product
+_BYTES_PER_USER = 32
+
+
+def plan_chunks(A, users, memory_budget, k=10):
+    """Split users into consecutive chunks whose scoring fits in the memory
+    budget. A user's row of A·Aᵀ has at most sum(in-degree of the users they
+    follow) nonzeros; on top of that every user costs a fixed amount for
+    their k output slots, so users who follow nobody still fill chunks.
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_array
+        Binary adjacency matrix, rows are followers
+
+    users : numpy.ndarray
+        Row indices to score, in output order
+
+    memory_budget : int
+        Bytes allowed for one chunk's product and output
+
+    k : int
+        Number of recommendations per user. Default value: 10
+
+    Returns
+    -------
+    bounds : list of tuples
+        (start, end) positions into users. A user whose row alone is over the
+        budget gets a chunk of their own.
+    """
+
+    in_degrees = np.bincount(A.indices, minlength=A.shape[1])
+    costs = (A @ in_degrees)[users] * _BYTES_PER_SHARED
+    costs += k * _BYTES_PER_REC + _BYTES_PER_USER
+    total = np.cumsum(costs)
+
+    bounds = []
+    start = 0
+    while start < len(users):
+        spent = total[start-1] if start else 0
+        end = int(np.searchsorted(total, spent + memory_budget, side='right'))
+        end = max(end, start + 1)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _chunk_paths(chunk_dir, i):
+    prefix = os.path.join(chunk_dir, f'chunk_{i:06d}')
+    return {column: f'{prefix}.{column}.npy'
+            for column in ('users', 'rec_ids', 'rec_scores')}
+
+
+@instrumented()
+def chunked_top_k(graph, out_dir, k=10, users=None,
+                  memory_budget=256 * 2**20, keep_chunks=False):
+    """Top k Jaccard recommendations for graphs whose scores don't fit in
+    memory. Users are scored in chunks sized to memory_budget, each chunk's
+    top k is written to disk as separate column files, and the chunks are
+    merged into one set of columns at the end.
+
+    Only the adjacency matrix, one chunk and the final memory-mapped output
+    are held at a time, so peak usage is about the size of A and Aᵀ plus
+    memory_budget, however many candidate pairs the graph has.
+
+    Output files in out_dir (load them with load_top_k):
+        users.npy        int32[m], node ID of each row
+        rec_ids.npy      int32[m, k], recommended node IDs, -1 where short
+        rec_scores.npy   float32[m, k], Jaccard coefficients
+        names.offsets.npy, names.blob.npy
+                         Usernames by node ID, readable with rec_store.load_strings
+
+    Parameters
+    ----------
+    graph : CompactGraph
+
+    out_dir : str
+        Directory for the results. Chunks go to out_dir/chunks.
+
+    k : int
+        Number of recommendations per user. Default value: 10
+
+    users : array-like of int, optional
+        Node IDs to score. If None, every node. Default value: None
+
+    memory_budget : int
+        Bytes allowed for scoring one chunk. Default value: 256 MiB
+
+    keep_chunks : bool
+        Keep the per-chunk files after merging. Default value: False
+
+    Returns
+    -------
+    result : dict
+        Memory-mapped 'users', 'rec_ids' and 'rec_scores' arrays, same as
+        load_top_k
+    """
+
+    chunk_dir = os.path.join(out_dir, 'chunks')
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    A = graph.to_csr()
+    # Transposed once here rather than by top_k_jaccard for every chunk
+    AT = A.T.tocsr()
+    if users is None:
+        users = np.arange(graph.num_nodes)
+    users = np.asarray(users, dtype=np.int64)
+    bounds = plan_chunks(A, users, memory_budget, k=k)
+
+    for i, (start, end) in enumerate(bounds):
+        rows = users[start:end]
+        with stage('chunked_scoring.chunk', items=len(rows)):
+            rec_ids, rec_scores = top_k_jaccard(A, k=k, users=rows,
+                                                chunk_size=len(rows), AT=AT)
+        paths = _chunk_paths(chunk_dir, i)
+        save_array(paths['users'], rows.astype(np.int32))
+        save_array(paths['rec_ids'], rec_ids)
+        save_array(paths['rec_scores'], rec_scores.astype(np.float32))
+        del rec_ids, rec_scores
+
+    del A, AT
+    merge_chunks(chunk_dir, out_dir, len(bounds), len(users), k)
+    save_strings(os.path.join(out_dir, 'names'), graph.names)
+    if not keep_chunks:
+        for path in glob.glob(os.path.join(chunk_dir, 'chunk_*.npy')):
+            os.remove(path)
+        os.rmdir(chunk_dir)
+    return load_top_k(out_dir)
+
+
+@instrumented()
+def merge_chunks(chunk_dir, out_dir, num_chunks, num_users, k):
+    """Concatenate per-chunk column files into users.npy, rec_ids.npy and
+    rec_scores.npy. Output is written through memory maps one chunk at a
+    time, so the merged arrays never have to fit in memory.
+
+    Parameters
+    ----------
+    chunk_dir : str
+        Directory with the chunk_<i>.<column>.npy files
+
+    out_dir : str
+        Directory for the merged files
+
+    num_chunks : int
+
+    num_users : int
+        Total number of rows over all chunks
+
+    k : int
+        Number of recommendations per user
+    """
+
+    columns = {
+        'users': (np.int32, (num_users,)),
+        'rec_ids': (np.int32, (num_users, k)),
+        'rec_scores': (np.float32, (num_users, k)),
+    }
+    for column, (dtype, shape) in columns.items():
+        path = os.path.join(out_dir, f'{column}.npy')
+        merged = np.lib.format.open_memmap(path + '.tmp', mode='w+',
+                                           dtype=dtype, shape=shape)
+        pos = 0
+        for i in range(num_chunks):
+            chunk = np.load(_chunk_paths(chunk_dir, i)[column], mmap_mode='r')
+            merged[pos:pos+len(chunk)] = chunk
+            pos += len(chunk)
+        merged.flush()
+        del merged
+        os.replace(path + '.tmp', path)
+
+
+def load_top_k(out_dir, mmap_mode='r'):
+    """Open the results written by chunked_top_k
+
+    Parameters
+    ----------
+    out_dir : str
+
+    mmap_mode : str, optional
+        Passed to numpy.load. Use None to read everything into memory.
+        Default value: 'r'
+
+    Returns
+    -------
+    result : dict
+        'users', 'rec_ids' and 'rec_scores' arrays, plus 'names', a
+        rec_store.StringColumn in node ID order: names[i] is the username of
+        node i.
+    """
+
+    result = {column: np.load(os.path.join(out_dir, f'{column}.npy'),
+                              mmap_mode=mmap_mode)
+              for column in ('users', 'rec_ids', 'rec_scores')}
+    result['names'] = load_strings(os.path.join(out_dir, 'names'), mmap_mode)
+    return result
@@ -0,0 +1,334 @@
+import argparse
+import os
+import pickle
+import numpy as np
+from compact_graph import CompactGraph
+from rec_store import load_strings, save_array, save_strings
+
+# Integer columns use this where the pickled dict had no such key
+MISSING = -1
+
+_USER_COUNTS = ('follower_count', 'follower_pgs', 'following_count',
+                'following_pgs')
+
+
+def _path(data_dir, column):
+    return os.path.join(data_dir, f'{column}.npy')
+
+
+def _save(data_dir, column, array):
+    save_array(_path(data_dir, column), array)
+
+
+def _load(data_dir, column, mmap_mode='r'):
+    return np.load(_path(data_dir, column), mmap_mode=mmap_mode)
+
+
+def write_strings(data_dir, column, strings):
+    """Store a list of strings as a uint64 offsets column and a uint8 blob
+    column, in the given order
+
+    Parameters
+    ----------
+    data_dir : str
+
+    column : str
+        Column name, e.g. 'users.name'. Files are <column>.offsets.npy and
+        <column>.blob.npy.
+
+    strings : iterable of str
+    """
+
+    save_strings(os.path.join(data_dir, column), strings)
+
+
+def read_strings(data_dir, column, mmap_mode='r'):
+    """Open a string column written by write_strings
+
+    Returns
+    -------
+    strings : rec_store.StringColumn
+        Supports len(), indexing and tolist(), in the order written
+    """
+
+    return load_strings(os.path.join(data_dir, column), mmap_mode)
+
+
+def _int_column(records, key):
+    return np.array([MISSING if record.get(key) is None else record[key]
+                     for record in records], dtype=np.int32)
+
+
+def write_user_dict(data_dir, user_dict):
+    """Store a user_dict as flat users and edges tables
+
+    Tables:
+        users.name         every username, user_dict keys first, then
+                           followers that aren't keys
+        users.scraped      bool, True for user_dict keys
+        users.<count>      int32 follower_count, follower_pgs,
+                           following_count and following_pgs, MISSING where
+                           the key is absent
+        edges.src          int32 follower ID
+        edges.dst          int32 followed user ID, in user_dict order, so the
+                           edges read back the same as edgelist_from_user_dict
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory for the tables. Created if needed.
+
+    user_dict : dict
+        Dictionary with users as keys and 'follower_count', 'follower_pgs' and
+        'followers' subkeys, as built by UserDict
+    """
+
+    os.makedirs(data_dir, exist_ok=True)
+    names = list(user_dict.keys())
+    ids = {name: i for i, name in enumerate(names)}
+    src = []
+    dst = []
+    for user, user_info in user_dict.items():
+        user_id = ids[user]
+        for follower in user_info.get('followers', []):
+            follower_id = ids.get(follower)
+            if follower_id is None:
+                follower_id = ids[follower] = len(names)
+                names.append(follower)
+            src.append(follower_id)
+            dst.append(user_id)
+
+    scraped = np.zeros(len(names), dtype=bool)
+    scraped[:len(user_dict)] = True
+    write_strings(data_dir, 'users.name', names)
+    _save(data_dir, 'users.scraped', scraped)
+    records = list(user_dict.values())
+    for key in _USER_COUNTS:
+        counts = np.full(len(names), MISSING, dtype=np.int32)
+        counts[:len(records)] = _int_column(records, key)
+        _save(data_dir, f'users.{key}', counts)
+    _save(data_dir, 'edges.src', np.array(src, dtype=np.int32))
+    _save(data_dir, 'edges.dst', np.array(dst, dtype=np.int32))
+
+
+def load_edges(data_dir, mmap_mode='r'):
+    """Follow edges as memory-mapped ID arrays, without unpickling anything
+
+    Parameters
+    ----------
+    data_dir : str
+
+    mmap_mode : str, optional
+        Passed to numpy.load. Use None to read into memory. Default value: 'r'
+
+    Returns
+    -------
+    names : rec_store.StringColumn
+        Username of each ID
+
+    src : numpy.ndarray
+        int32 follower IDs
+
+    dst : numpy.ndarray
+        int32 followed user IDs
+    """
+
+    return (read_strings(data_dir, 'users.name', mmap_mode),
+            _load(data_dir, 'edges.src', mmap_mode),
+            _load(data_dir, 'edges.dst', mmap_mode))
+
+
+def load_compact_graph(data_dir):
+    """CompactGraph over the stored edges. The edge arrays stay memory-mapped;
+    only the name table is decoded."""
+    names, src, dst = load_edges(data_dir)
+    names = names.tolist()
+    return CompactGraph(names, {name: i for i, name in enumerate(names)},
+                        src, dst)
+
+
+def load_edgelist(data_dir):
+    """List of (u, v) tuples, same as edgelist_from_user_dict"""
+    names, src, dst = load_edges(data_dir)
+    names = names.tolist()
+    return [(names[u], names[v]) for u, v in zip(src.tolist(), dst.tolist())]
+
+
+def load_user_dict(data_dir):
+    """Rebuild the nested user_dict, for code that still expects it"""
+    names, src, dst = load_edges(data_dir)
+    names = names.tolist()
+    num_scraped = int(_load(data_dir, 'users.scraped').sum())
+    counts = {key: _load(data_dir, f'users.{key}').tolist()
+              for key in _USER_COUNTS}
+
+    user_dict = {}
+    for i in range(num_scraped):
+        user_info = {key: counts[key][i] for key in _USER_COUNTS
+                     if counts[key][i] != MISSING}
+        user_info['followers'] = []
+        user_dict[names[i]] = user_info
+    for u, v in zip(src.tolist(), dst.tolist()):
+        user_dict[names[v]]['followers'].append(names[u])
+    return user_dict
+
+
+def write_all_urls(data_dir, all_urls):
+    """Store the list of usernames still to be scraped"""
+    os.makedirs(data_dir, exist_ok=True)
+    write_strings(data_dir, 'all_urls.name', all_urls)
+
+
+def load_all_urls(data_dir):
+    return read_strings(data_dir, 'all_urls.name').tolist()
+
+
+def write_tea_dict(data_dir, tea_dict):
+    """Store a tea_dict as flat teas, reviews and flavors tables
+
+    Tables:
+        teas.id, teas.name, teas.brand, teas.url
+                           strings, one row per tea in tea_dict order
+        teas.rating, teas.review_pages
+                           int32, MISSING where absent
+        teas.has_reviewers, teas.has_flavors
+                           bool, whether the tea has the subkey at all
+        reviewers.name     every reviewer username
+        reviews.tea        int32 tea row
+        reviews.reviewer   int32 reviewer row
+        reviews.weight     int32 rating as scraped (1000 for no rating)
+        flavor_names.name  every flavor
+        flavors.tea        int32 tea row
+        flavors.flavor     int32 flavor row, in each tea's listed order
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory for the tables. Created if needed.
+
+    tea_dict : dict
+        Tea dictionary from TeaDict
+    """
+
+    os.makedirs(data_dir, exist_ok=True)
+    teas = list(tea_dict.values())
+    write_strings(data_dir, 'teas.id', tea_dict.keys())
+    for key in ('name', 'brand', 'url'):
+        write_strings(data_dir, f'teas.{key}',
+                      [tea.get(key, '') for tea in teas])
+    _save(data_dir, 'teas.rating', _int_column(teas, 'rating'))
+    _save(data_dir, 'teas.review_pages', _int_column(teas, 'review_pages'))
+    _save(data_dir, 'teas.has_reviewers',
+          np.array(['reviewers' in tea for tea in teas], dtype=bool))
+    _save(data_dir, 'teas.has_flavors',
+          np.array(['flavors' in tea for tea in teas], dtype=bool))
+
+    reviewer_ids = {}
+    review_tea, review_reviewer, review_weight = [], [], []
+    flavor_ids = {}
+    flavor_tea, flavor_flavor = [], []
+    for row, tea in enumerate(teas):
+        for reviewer, review in tea.get('reviewers', {}).items():
+            review_tea.append(row)
+            review_reviewer.append(reviewer_ids.setdefault(reviewer,
+                                                           len(reviewer_ids)))
+            review_weight.append(review['weight'])
+        for flavor in tea.get('flavors') or []:
+            flavor_tea.append(row)
+            flavor_flavor.append(flavor_ids.setdefault(flavor, len(flavor_ids)))
+
+    write_strings(data_dir, 'reviewers.name', reviewer_ids.keys())
+    _save(data_dir, 'reviews.tea', np.array(review_tea, dtype=np.int32))
+    _save(data_dir, 'reviews.reviewer',
+          np.array(review_reviewer, dtype=np.int32))
+    _save(data_dir, 'reviews.weight', np.array(review_weight, dtype=np.int32))
+    write_strings(data_dir, 'flavor_names.name', flavor_ids.keys())
+    _save(data_dir, 'flavors.tea', np.array(flavor_tea, dtype=np.int32))
+    _save(data_dir, 'flavors.flavor', np.array(flavor_flavor, dtype=np.int32))
+
+
+def load_reviews(data_dir, mmap_mode='r'):
+    """Review table as memory-mapped columns
+
+    Returns
+    -------
+    reviews : dict
+        'tea', 'reviewer' and 'weight' arrays, plus 'tea_ids' and 'reviewers'
+        string columns to look up the rows they point at
+    """
+
+    reviews = {column: _load(data_dir, f'reviews.{column}', mmap_mode)
+               for column in ('tea', 'reviewer', 'weight')}
+    reviews['tea_ids'] = read_strings(data_dir, 'teas.id', mmap_mode)
+    reviews['reviewers'] = read_strings(data_dir, 'reviewers.name', mmap_mode)
+    return reviews
+
+
+def load_tea_dict(data_dir):
+    """Rebuild the nested tea_dict, for code that still expects it"""
+    tea_ids = read_strings(data_dir, 'teas.id').tolist()
+    columns = {key: read_strings(data_dir, f'teas.{key}').tolist()
+               for key in ('name', 'brand', 'url')}
+    rating = _load(data_dir, 'teas.rating').tolist()
+    review_pages = _load(data_dir, 'teas.review_pages').tolist()
+    has_reviewers = _load(data_dir, 'teas.has_reviewers').tolist()
+    has_flavors = _load(data_dir, 'teas.has_flavors').tolist()
+
+    tea_dict = {}
+    for row, tea_id in enumerate(tea_ids):
+        tea = {key: columns[key][row] for key in ('name', 'brand', 'url')}
+        if rating[row] != MISSING:
+            tea['rating'] = rating[row]
+        if review_pages[row] != MISSING:
+            tea['review_pages'] = review_pages[row]
+        if has_reviewers[row]:
+            tea['reviewers'] = {}
+        if has_flavors[row]:
+            tea['flavors'] = []
+        tea_dict[tea_id] = tea
+
+    reviewers = read_strings(data_dir, 'reviewers.name').tolist()
+    for row, reviewer, weight in zip(_load(data_dir, 'reviews.tea').tolist(),
+                                     _load(data_dir, 'reviews.reviewer').tolist(),
+                                     _load(data_dir, 'reviews.weight').tolist()):
+        tea_dict[tea_ids[row]]['reviewers'][reviewers[reviewer]] = {
+            'weight': weight}
+
+    flavor_names = read_strings(data_dir, 'flavor_names.name').tolist()
+    for row, flavor in zip(_load(data_dir, 'flavors.tea').tolist(),
+                           _load(data_dir, 'flavors.flavor').tolist()):
+        tea_dict[tea_ids[row]]['flavors'].append(flavor_names[flavor])
+    return tea_dict
+
+
+def convert_pickles(pickle_dir='../data/pickled-data',
+                    data_dir='../data/columnar'):
+    """One-time conversion of user_dict.p, tea_dict.p and all_urls.p into
+    columnar tables. Pickles that don't exist are skipped.
+
+    Parameters
+    ----------
+    pickle_dir : str
+        Directory with the pickles. Default value: '../data/pickled-data'
+
+    data_dir : str
+        Directory for the tables. Default value: '../data/columnar'
+    """
+
+    writers = {'user_dict': write_user_dict, 'tea_dict': write_tea_dict,
+               'all_urls': write_all_urls}
+    for name, write in writers.items():
+        path = os.path.join(pickle_dir, f'{name}.p')
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as p:
+            write(data_dir, pickle.load(p))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Convert the pickled dicts to columnar .npy tables')
+    parser.add_argument('--pickle-dir', default='../data/pickled-data')
+    parser.add_argument('--data-dir', default='../data/columnar')
+    args = parser.parse_args()
+    convert_pickles(args.pickle_dir, args.data_dir)
@@ -0,0 +1,606 @@
+import numpy as np
+import scipy.sparse as sp
+import scipy.stats as stats
+from parallel import process_pool, worker_state
+
+
+class CompactGraph:
+    """
+    A follow graph stored as two int32 arrays of node IDs. Usernames are
+    interned to contiguous IDs once at ingest, and every later stage (scoring,
+    splitting, evaluation) works on the IDs. Names are only looked up again
+    when results are handed back.
+
+    ...
+
+    Attributes
+    ----------
+    names : list
+        Username for each node ID. names[i] is the user with ID i.
+
+    ids : dict
+        Node ID for each username, the reverse of names.
+
+    src : numpy.ndarray
+        int32 array of follower IDs. Edge e is src[e] -> dst[e], i.e. src[e]
+        follows dst[e], same as the (u, v) tuples from edgelist_from_user_dict.
+
+    dst : numpy.ndarray
+        int32 array of followed user IDs
+
+    Methods
+    -------
+    from_user_dict(user_dict)
+        Intern a user_dict straight into a CompactGraph.
+
+    from_edgelist(edgelist)
+        Intern a list of (u, v) tuples.
+
+    to_names(node_ids)
+        Convert node IDs back to usernames.
+
+    to_edgelist()
+        List of (u, v) username tuples, same as edgelist_from_user_dict.
+
+    to_csr()
+        Binary CSR adjacency matrix with rows for followers.
+
+    out_degree()
+        Number of users each node follows.
+
+    train_test_split(split_percent=.8, seed=123)
+        Random train/test split that keeps the shared name table.
+
+    top_k(k=10, users=None)
+        Top k Jaccard recommendations for each user as ID arrays.
+
+    """
+
+    def __init__(self, names, ids, src, dst):
+        self.names = names
+        self.ids = ids
+        self.src = np.asarray(src, dtype=np.int32)
+        self.dst = np.asarray(dst, dtype=np.int32)
+
+    @classmethod
+    def from_user_dict(cls, user_dict):
+        """Intern a user_dict straight into a CompactGraph, without building
+        the list of (str, str) tuples first.
+
+        Parameters
+        ----------
+        user_dict : dict
+            Dictionary with users as keys and followers as values in the
+            'followers' subkey
+
+        Returns
+        -------
+        graph : CompactGraph
+        """
+
+        names = []
+        ids = {}
+        src = []
+        dst = []
+        for user in user_dict.keys():
+            followers = user_dict[user].get('followers')
+            if not followers:
+                continue
+            user_id = ids.get(user)
+            if user_id is None:
+                user_id = ids[user] = len(names)
+                names.append(user)
+            for follower in followers:
+                follower_id = ids.get(follower)
+                if follower_id is None:
+                    follower_id = ids[follower] = len(names)
+                    names.append(follower)
+                src.append(follower_id)
+                dst.append(user_id)
+        return cls(names, ids, np.array(src, dtype=np.int32),
+                   np.array(dst, dtype=np.int32))
+
+    @classmethod
+    def from_edgelist(cls, edgelist):
+        """Intern a list of (u, v) tuples
+
+        Parameters
+        ----------
+        edgelist : list of tuples
+            Tuples (u, v) where u is the user and v is someone they follow
+
+        Returns
+        -------
+        graph : CompactGraph
+        """
+
+        names = []
+        ids = {}
+        src = np.empty(len(edgelist), dtype=np.int32)
+        dst = np.empty(len(edgelist), dtype=np.int32)
+        for e, (u, v) in enumerate(edgelist):
+            u_id = ids.get(u)
+            if u_id is None:
+                u_id = ids[u] = len(names)
+                names.append(u)
+            v_id = ids.get(v)
+            if v_id is None:
+                v_id = ids[v] = len(names)
+                names.append(v)
+            src[e] = u_id
+            dst[e] = v_id
+        return cls(names, ids, src, dst)
+
+    @property
+    def num_nodes(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.src)
+
+    def with_edges(self, src, dst):
+        """New CompactGraph over the same name table with different edges"""
+        return CompactGraph(self.names, self.ids, src, dst)
+
+    def to_names(self, node_ids):
+        """Convert node IDs back to usernames
+
+        Parameters
+        ----------
+        node_ids : iterable of int
+
+        Returns
+        -------
+        names : list
+        """
+
+        names = self.names
+        return [names[i] for i in np.asarray(node_ids).tolist()]
+
+    def to_edgelist(self):
+        """List of (u, v) username tuples, same as edgelist_from_user_dict"""
+        return list(zip(self.to_names(self.src), self.to_names(self.dst)))
+
+    def to_csr(self):
+        """Binary CSR adjacency matrix. Row i holds the users that i follows.
+
+        Returns
+        -------
+        A : scipy.sparse.csr_array
+        """
+
+        n = self.num_nodes
+        data = np.ones(len(self.src), dtype=np.int32)
+        A = sp.csr_array((data, (self.src, self.dst)), shape=(n, n))
+        A.sum_duplicates()
+        A.data[:] = 1
+        return A
+
+    def out_degree(self):
+        """Number of users each node follows, indexed by node ID"""
+        return np.bincount(self.src, minlength=self.num_nodes)
+
+    def train_test_split(self, split_percent=.8, seed=123, per_user=False):
+        """Randomly split the edges into train and test graphs. Both graphs
+        share this graph's name table, so IDs mean the same thing in each.
+
+        Parameters
+        ----------
+        split_percent : float
+            Train-test split percentage. Default value: .8
+
+        seed : int
+            Random seed. Default value: 123
+
+        per_user : bool
+            Split each user's follows separately, see split_mask.
+            Default value: False
+
+        Returns
+        -------
+        train : CompactGraph
+            Portion of the edges designated for training and predicting
+
+        test : CompactGraph
+            Portion of the edges set aside as holdout data
+        """
+
+        test_mask = split_mask(self.src, split_percent=split_percent,
+                               seed=seed, per_user=per_user)
+        train_mask = ~test_mask
+        return (self.with_edges(self.src[train_mask], self.dst[train_mask]),
+                self.with_edges(self.src[test_mask], self.dst[test_mask]))
+
+    def top_k(self, k=10, users=None, chunk_size=1024):
+        """Top k Jaccard recommendations for each user. Users they already
+        follow are left out.
+
+        Parameters
+        ----------
+        k : int
+            Number of recommendations per user. Default value: 10
+
+        users : array-like of int, optional
+            Node IDs to recommend for. If None, every node. Default value: None
+
+        chunk_size : int
+            Number of users whose rows of A·Aᵀ are held at once.
+            Default value: 1024
+
+        Returns
+        -------
+        rec_ids : numpy.ndarray
+            int32 array of shape (len(users), k). Rows are padded with -1 when
+            a user has fewer than k candidates.
+
+        rec_scores : numpy.ndarray
+            float64 array of shape (len(users), k) with the Jaccard
+            coefficients, 0 where rec_ids is -1
+        """
+
+        A = self.to_csr()
+        return top_k_jaccard(A, k=k, users=users, chunk_size=chunk_size)
+
+
+def split_mask(src, split_percent=.8, seed=123, per_user=False):
+    """Test-set mask for a random train/test split of an edge array. Nothing
+    is copied or reordered, so the mask can be applied to src, dst or any
+    other per-edge array.
+
+    Parameters
+    ----------
+    src : numpy.ndarray
+        Follower ID of each edge
+
+    split_percent : float
+        Share of edges kept in train. Default value: .8
+
+    seed : int
+        Random seed. Default value: 123
+
+    per_user : bool
+        If False, split_percent of all edges go to train, picked at random.
+        If True, each user's follows are split separately, so every user with
+        at least two follows has at least one in test and one in train.
+        Default value: False
+
+    Returns
+    -------
+    test_mask : numpy.ndarray
+        Boolean array, True for test edges
+    """
+
+    rng = np.random.default_rng(seed)
+    num_edges = len(src)
+    order = rng.permutation(num_edges)
+    test_mask = np.zeros(num_edges, dtype=bool)
+    if not per_user:
+        test_mask[order[int((num_edges+1)*split_percent):]] = True
+        return test_mask
+
+    # Group the shuffled edges by user; an edge's rank inside its group
+    # decides whether it is held out
+    order = order[np.argsort(src[order], kind='stable')]
+    degrees = np.bincount(src, minlength=int(src.max()) + 1 if num_edges else 0)
+    starts = np.cumsum(degrees) - degrees
+    sorted_src = src[order]
+    rank = np.arange(num_edges) - starts[sorted_src]
+    num_test = np.rint(degrees * (1 - split_percent)).astype(np.int64)
+    num_test = np.clip(num_test, np.minimum(degrees, 2) - 1, degrees - 1)
+    test_mask[order] = rank < num_test[sorted_src]
+    return test_mask
+
+
+def top_k_jaccard(A, k=10, users=None, chunk_size=1024, AT=None):
+    """Top k Jaccard recommendations for each row of a CSR adjacency matrix
+
+    Parameters
+    ----------
+    A : scipy.sparse.csr_array
+        Binary adjacency matrix, rows are followers
+
+    k : int
+        Number of recommendations per user. Default value: 10
+
+    users : array-like of int, optional
+        Row indices to recommend for. If None, every row. Default value: None
+
+    chunk_size : int
+        Number of rows of A·Aᵀ held at once. Default value: 1024
+
+    AT : scipy.sparse.csr_array, optional
+        A.T in CSR form, for callers that score the same graph many times. If
+        None, it is built here. Default value: None
+
+    Returns
+    -------
+    rec_ids : numpy.ndarray
+        int32 array of shape (len(users), k), padded with -1
+
+    rec_scores : numpy.ndarray
+        float64 array of shape (len(users), k), 0 where rec_ids is -1
+    """
+
+    if users is None:
+        users = np.arange(A.shape[0])
+    users = np.asarray(users, dtype=np.int64)
+    degrees = np.diff(A.indptr)
+    if AT is None:
+        AT = A.T.tocsr()
+
+    rec_ids = np.full((len(users), k), -1, dtype=np.int32)
+    rec_scores = np.zeros((len(users), k))
+    for lo in range(0, len(users), chunk_size):
+        rows = users[lo:lo+chunk_size]
+        shared = (A[rows] @ AT).tocsr()
+        for r, i in enumerate(rows.tolist()):
+            start, end = shared.indptr[r], shared.indptr[r+1]
+            cols = shared.indices[start:end]
+            inter = shared.data[start:end]
+            keep = cols != i
+            keep &= ~np.isin(cols, A.indices[A.indptr[i]:A.indptr[i+1]])
+            cols, inter = cols[keep], inter[keep]
+            if len(cols) == 0:
+                continue
+            p = inter / (degrees[i] + degrees[cols] - inter)
+            # Highest p first, lower node ID first on ties
+            order = np.lexsort((cols, -p))[:k]
+            rec_ids[lo+r, :len(order)] = cols[order]
+            rec_scores[lo+r, :len(order)] = p[order]
+    return rec_ids, rec_scores
+
+
+def precision_curves(rec_ids, users, test, k=50):
+    """Precision at every level from 1 to k for each user, computed from ID
+    arrays. Hits are found by matching edge codes (u * n + v) against the test
+    edges, so no tuples are hashed.
+
+    Parameters
+    ----------
+    rec_ids : numpy.ndarray
+        Output of top_k_jaccard, shape (len(users), >= k)
+
+    users : array-like of int
+        Node ID for each row of rec_ids
+
+    test : CompactGraph
+        Holdout edges
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    Returns
+    -------
+    p_at_k : numpy.ndarray
+        Array of shape (len(users), k). Short recommendation lists are scored
+        the same way calculate_precision_at_k scores them.
+    """
+
+    n = np.int64(test.num_nodes)
+    test_codes = np.unique(test.src.astype(np.int64) * n + test.dst)
+    return _precision_curves_from_codes(rec_ids, users, test_codes, n, k)
+
+
+def _precision_curves_from_codes(rec_ids, users, test_codes, n, k):
+    rec_ids = rec_ids[:, :k]
+    users = np.asarray(users, dtype=np.int64)
+    rec_codes = users[:, None] * n + rec_ids
+    hits = np.isin(rec_codes, test_codes) & (rec_ids >= 0)
+
+    list_lengths = (rec_ids >= 0).sum(axis=1)
+    total_preds = np.minimum(np.arange(1, k+1)[None, :], list_lengths[:, None])
+    cumulative = np.cumsum(hits, axis=1)
+    total_correct = np.take_along_axis(cumulative,
+                                       np.maximum(total_preds - 1, 0), axis=1)
+    return np.divide(total_correct, total_preds, out=np.zeros(total_preds.shape),
+                     where=total_preds > 0)
+
+
+def calculate_precision_at_k(train, test, full, H_threshold, n=100, k=50,
+                             seed=123):
+    """Compact version of jaccard_recs.calculate_precision_at_k. Sampling,
+    scoring and hit counting all run on node IDs, and usernames only appear
+    as the keys of p_at_k_dict.
+
+    Parameters
+    ----------
+    train : CompactGraph
+        Edges used for predicting
+
+    test : CompactGraph
+        Holdout edges, sharing train's name table
+
+    full : CompactGraph
+        All edges, used for the out-degree threshold
+
+    H_threshold : int
+        Minimum out-degree required to be considered for recommendation
+
+    n : int
+        Number of nodes to sample. Default value: 100
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    seed : int
+        Random seed. Default value: 123
+
+    Returns
+    -------
+    p_at_k_all : list of lists
+        List of lists where each sublist corresponds to a user n and each
+        element of the sublist represents precision at each level of k.
+
+    p_at_k_dict : dict
+        Dictionary with username as key and value is a list of precision at
+        each level of k.
+    """
+
+    train_nodes = np.unique(np.concatenate([train.src, train.dst]))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(train_nodes, size=min(n, len(train_nodes)),
+                        replace=False)
+    sample = sample[full.out_degree()[sample] >= H_threshold]
+
+    rec_ids, _ = top_k_jaccard(train.to_csr(), k=k, users=sample)
+    p_at_k = precision_curves(rec_ids, sample, test, k=k)
+
+    p_at_k_all = p_at_k.tolist()
+    p_at_k_dict = dict(zip(train.to_names(sample), p_at_k_all))
+    return p_at_k_all, p_at_k_dict
+
+
+def fold_masks(num_edges, folds=5, repeats=1, split_percent=None, seed=123):
+    """Test-set masks for k-fold or repeated random-split evaluation
+
+    Parameters
+    ----------
+    num_edges : int
+
+    folds : int
+        Number of folds per repeat. Every edge is in exactly one fold's test
+        set within a repeat. Ignored if split_percent is set. Default value: 5
+
+    repeats : int
+        Number of times the folds (or the split) are redrawn with a new
+        shuffle. Default value: 1
+
+    split_percent : float, optional
+        If set, each repeat is a single random train/test split with this
+        share of edges in train, like train_test_split. Default value: None
+
+    seed : int
+        Random seed. Default value: 123
+
+    Returns
+    -------
+    test_masks : list of numpy.ndarray
+        One boolean array of length num_edges per fold, True for test edges
+    """
+
+    rng = np.random.default_rng(seed)
+    test_masks = []
+    for _ in range(repeats):
+        order = rng.permutation(num_edges)
+        if split_percent is not None:
+            mask = np.zeros(num_edges, dtype=bool)
+            mask[order[int((num_edges+1)*split_percent):]] = True
+            test_masks.append(mask)
+            continue
+        assignment = np.empty(num_edges, dtype=np.int64)
+        assignment[order] = np.arange(num_edges) % folds
+        test_masks.extend(assignment == fold for fold in range(folds))
+    return test_masks
+
+
+def _worker_fold_precision(task):
+    fold, test_mask = task
+    return _fold_precision(fold, test_mask, **worker_state)
+
+
+def _fold_precision(fold, test_mask, src, dst, num_nodes, out_degree,
+                    H_threshold, n, k, seed):
+    # Train adjacency for one fold, cut straight from the sorted, deduplicated
+    # edge arrays: the rows stay in order, so only indptr has to be recounted
+    keep = ~test_mask
+    train_src, train_dst = src[keep], dst[keep]
+    indptr = np.zeros(num_nodes+1, dtype=np.int64)
+    np.cumsum(np.bincount(train_src, minlength=num_nodes), out=indptr[1:])
+    A = sp.csr_array((np.ones(len(train_dst), dtype=np.int32), train_dst,
+                      indptr), shape=(num_nodes, num_nodes))
+
+    in_train = np.zeros(num_nodes, dtype=bool)
+    in_train[train_src] = True
+    in_train[train_dst] = True
+    train_nodes = np.flatnonzero(in_train)
+    rng = np.random.default_rng([seed, fold])
+    sample = rng.choice(train_nodes, size=min(n, len(train_nodes)),
+                        replace=False)
+    sample = sample[out_degree[sample] >= H_threshold]
+
+    test_codes = src[test_mask].astype(np.int64) * num_nodes + dst[test_mask]
+    rec_ids, _ = top_k_jaccard(A, k=k, users=sample)
+    return _precision_curves_from_codes(rec_ids, sample, test_codes,
+                                        np.int64(num_nodes), k)
+
+
+def kfold_precision_at_k(graph, H_threshold=1, folds=5, repeats=1,
+                         split_percent=None, n=100, k=50, seed=123, n_jobs=1,
+                         confidence=.95):
+    """Precision at k over several train/test splits of one graph, with a
+    confidence interval, instead of hanging on a single random split.
+
+    The edges are deduplicated and sorted once. Each fold's train adjacency
+    is then a boolean mask over those arrays, so no graph is rebuilt from
+    tuples, and folds can run in parallel on a process pool.
+
+    Parameters
+    ----------
+    graph : CompactGraph
+        All edges. Also used for the out-degree threshold.
+
+    H_threshold : int
+        Minimum out-degree required to be considered for recommendation.
+        Default value: 1
+
+    folds, repeats, split_percent :
+        How the test sets are drawn, see fold_masks.
+        Default values: 5, 1, None
+
+    n : int
+        Number of nodes sampled in each fold. Default value: 100
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    seed : int
+        Random seed for the folds and the samples. Default value: 123
+
+    n_jobs : int
+        Number of worker processes. Use -1 for one per CPU. Default value: 1
+
+    confidence : float
+        Confidence level of the interval. Default value: .95
+
+    Returns
+    -------
+    result : dict
+        'fold_p_at_k' (array of mean precision at each level of k, one row
+        per fold), 'n_users' (users evaluated in each fold), 'mean', 'ci_low'
+        and 'ci_high' (Student t interval of the mean across folds, clipped
+        to [0, 1] since precision can't leave that range; NaN with a single
+        fold)
+    """
+
+    num_nodes = np.int64(graph.num_nodes)
+    codes = np.unique(graph.src.astype(np.int64) * num_nodes + graph.dst)
+    src, dst = np.divmod(codes, num_nodes)
+    src, dst = src.astype(np.int32), dst.astype(np.int32)
+    out_degree = np.bincount(src, minlength=num_nodes)
+
+    test_masks = fold_masks(len(codes), folds=folds, repeats=repeats,
+                            split_percent=split_percent, seed=seed)
+    state = dict(src=src, dst=dst, num_nodes=int(num_nodes),
+                 out_degree=out_degree, H_threshold=H_threshold, n=n, k=k,
+                 seed=seed)
+    tasks = list(enumerate(test_masks))
+    if n_jobs == 1:
+        curves = [_fold_precision(fold, mask, **state) for fold, mask in tasks]
+    else:
+        pool, n_jobs = process_pool(n_jobs, initargs=(state,))
+        with pool:
+            curves = pool.map(_worker_fold_precision, tasks, chunksize=1)
+
+    n_users = np.array([len(p) for p in curves])
+    fold_p_at_k = np.array([p.mean(axis=0) if len(p) else np.zeros(k)
+                            for p in curves])
+    mean = fold_p_at_k.mean(axis=0)
+    if len(curves) > 1:
+        sem = fold_p_at_k.std(axis=0, ddof=1) / np.sqrt(len(curves))
+        half_width = stats.t.ppf((1 + confidence) / 2, len(curves) - 1) * sem
+    else:
+        half_width = np.full(k, np.nan)
+    return {'fold_p_at_k': fold_p_at_k, 'n_users': n_users, 'mean': mean,
+            'ci_low': np.clip(mean - half_width, 0, 1),
+            'ci_high': np.clip(mean + half_width, 0, 1)}
@@ -0,0 +1,234 @@
+import argparse
+import os
+import struct
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from compact_graph import CompactGraph
+from rec_store import NameTable, pad
+
+_MAGIC = b'TEAGRPH1'
+# magic, number of nodes, number of edges, size of the name blob, bytes per
+# index (4 or 8, used for indptr and indices alike)
+_HEADER = struct.Struct('<8sQQQQ')
+
+
+def _csr(rows, cols, num_nodes, index_dtype):
+    # Sorted, deduplicated CSR arrays from row and column IDs
+    codes = np.unique(rows.astype(np.int64) * num_nodes + cols)
+    rows, cols = np.divmod(codes, num_nodes)
+    indptr = np.zeros(num_nodes+1, dtype=index_dtype)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    return indptr, cols.astype(index_dtype)
+
+
+def write_snapshot(path, G):
+    """Save a follow graph as one flat binary file that GraphSnapshot can
+    memory-map. Out-edges and in-edges are both stored as CSR arrays, so
+    successors and predecessors are each a single slice.
+
+    File layout (little-endian, every section 8-byte aligned):
+        header       magic, number of nodes, number of edges, size of the name
+                     blob, bytes per index
+        offsets      uint64[number of nodes + 1]
+        names        UTF-8 bytes of the usernames, sorted; node IDs follow
+                     this order
+        indptr       index[number of nodes + 1], out-edges (who u follows)
+        indices      index[number of edges]
+        in_indptr    index[number of nodes + 1], in-edges (u's followers)
+        in_indices   index[number of edges]
+
+    Parameters
+    ----------
+    path : str
+        File to write. It is written to path + '.tmp' first and then renamed,
+        so readers never see a half-written file.
+
+    G : A NetworkX graph or CompactGraph
+        Directed follow graph. Duplicate edges are stored once.
+    """
+
+    if isinstance(G, CompactGraph):
+        old_names, src, dst = G.names, G.src, G.dst
+    else:
+        old_names = list(G.nodes)
+        old_ids = {name: i for i, name in enumerate(old_names)}
+        src = np.fromiter((old_ids[u] for u, _ in G.edges), dtype=np.int64,
+                          count=G.number_of_edges())
+        dst = np.fromiter((old_ids[v] for _, v in G.edges), dtype=np.int64,
+                          count=G.number_of_edges())
+
+    names, offsets, blob = NameTable.encode(old_names)
+    index = {name: i for i, name in enumerate(names)}
+    relabel = np.fromiter((index[str(name)] for name in old_names),
+                          dtype=np.int64, count=len(old_names))
+    src, dst = relabel[src], relabel[dst]
+
+    num_nodes = len(names)
+    index_dtype = np.int32 if max(len(src), num_nodes) < 2**31 else np.int64
+    indptr, indices = _csr(src, dst, num_nodes, index_dtype)
+    in_indptr, in_indices = _csr(dst, src, num_nodes, index_dtype)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, num_nodes, len(indices), len(blob),
+                             np.dtype(index_dtype).itemsize))
+        f.write(offsets.tobytes())
+        f.write(blob)
+        f.write(b'\0' * pad(len(blob)))
+        for array in (indptr, indices, in_indptr, in_indices):
+            f.write(array.tobytes())
+            f.write(b'\0' * pad(array.nbytes))
+    os.replace(tmp_path, path)
+
+
+class GraphSnapshot:
+    """
+    Memory-mapped reader for files written by write_snapshot. Opening a
+    snapshot only maps the file, so a cold start takes milliseconds, and
+    processes that open the same file share one copy through the page cache.
+
+    ...
+
+    Attributes
+    ----------
+    names : NameTable
+        Sorted usernames. names[i] is the user with node ID i.
+
+    indptr, indices : numpy.ndarray
+        Out-edge CSR arrays: node i follows indices[indptr[i]:indptr[i+1]]
+
+    in_indptr, in_indices : numpy.ndarray
+        In-edge CSR arrays: node i is followed by
+        in_indices[in_indptr[i]:in_indptr[i+1]]
+
+    Methods
+    -------
+    node_id(user)
+        Node ID of a username, or -1 if it isn't in the graph.
+
+    successors(user)
+        Usernames that a user follows.
+
+    predecessors(user)
+        Usernames that follow a user.
+
+    to_csr()
+        Binary CSR adjacency matrix over the mapped arrays.
+
+    to_compact_graph()
+        CompactGraph over the same node IDs.
+
+    to_networkx()
+        NetworkX DiGraph, same as building one from the edgelist.
+
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            File written by write_snapshot
+        """
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, num_nodes, num_edges, blob_size, index_size = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a graph snapshot")
+        index_dtype = np.int32 if index_size == 4 else np.int64
+
+        pos = _HEADER.size
+        offsets = self._mm[pos:pos + 8*(num_nodes+1)].view(np.uint64)
+        pos += 8*(num_nodes+1)
+        blob = self._mm[pos:pos + blob_size]
+        pos += blob_size + pad(blob_size)
+        self.names = NameTable(offsets, blob)
+
+        arrays = []
+        for length in (num_nodes+1, num_edges, num_nodes+1, num_edges):
+            size = index_size * length
+            arrays.append(self._mm[pos:pos + size].view(index_dtype))
+            pos += size + pad(size)
+        self.indptr, self.indices, self.in_indptr, self.in_indices = arrays
+
+    @property
+    def num_nodes(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def __len__(self):
+        return self.num_nodes
+
+    def __contains__(self, user):
+        return self.names.index(user) >= 0
+
+    def node_id(self, user):
+        """Node ID of a username, or -1 if it isn't in the graph"""
+        return self.names.index(user)
+
+    def _neighbors(self, user, indptr, indices):
+        i = self.names.index(user)
+        if i < 0:
+            raise nx.NodeNotFound(f"Node {user} is not in the graph.")
+        return [self.names[j] for j in indices[indptr[i]:indptr[i+1]].tolist()]
+
+    def successors(self, user):
+        """Usernames that a user follows"""
+        return self._neighbors(user, self.indptr, self.indices)
+
+    def predecessors(self, user):
+        """Usernames that follow a user"""
+        return self._neighbors(user, self.in_indptr, self.in_indices)
+
+    def out_degree(self):
+        """Number of users each node follows, indexed by node ID"""
+        return np.diff(self.indptr)
+
+    def to_csr(self):
+        """Binary CSR adjacency matrix. Row i holds the users that i follows.
+        indptr and indices are the mapped arrays; only the data array of ones
+        is allocated.
+
+        Returns
+        -------
+        A : scipy.sparse.csr_array
+        """
+
+        data = np.ones(self.num_edges, dtype=np.int32)
+        return sp.csr_array((data, self.indices, self.indptr),
+                            shape=(self.num_nodes, self.num_nodes), copy=False)
+
+    def to_compact_graph(self):
+        """CompactGraph with the same node IDs. dst is the mapped indices
+        array; the name table is decoded."""
+        names = [self.names[i] for i in range(self.num_nodes)]
+        src = np.repeat(np.arange(self.num_nodes, dtype=np.int32),
+                        self.out_degree())
+        return CompactGraph(names, {name: i for i, name in enumerate(names)},
+                            src, self.indices)
+
+    def to_networkx(self):
+        """NetworkX DiGraph with the same nodes and edges"""
+        graph = self.to_compact_graph()
+        G = nx.DiGraph()
+        G.add_nodes_from(graph.names)
+        G.add_edges_from(graph.to_edgelist())
+        return G
+
+
+if __name__ == "__main__":
+    import jaccard_recs as jr
+
+    parser = argparse.ArgumentParser(
+        description='Write a graph snapshot from the pickled user_dict')
+    parser.add_argument('--user-dict', default='../data/pickled-data/user_dict.p')
+    parser.add_argument('--output', default='../data/follow_graph.snapshot')
+    args = parser.parse_args()
+
+    user_dict = jr.import_user_dict(args.user_dict)
+    write_snapshot(args.output, CompactGraph.from_user_dict(user_dict))
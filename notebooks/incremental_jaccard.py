@@ -0,0 +1,204 @@
+import heapq
+
+
+class IncrementalJaccard:
+    """
+    Keeps Jaccard shared-neighbor counts and each user's top k
+    recommendations up to date as new follow edges are scraped, so a batch of
+    new edges does not mean rebuilding the graph and rescoring everyone.
+
+    Only shared-neighbor counts are stored. Union sizes are worked out from
+    the two out-degrees when a score is needed, so a new edge u -> w only
+    touches the counts between u and the other followers of w.
+
+    ...
+
+    Attributes
+    ----------
+    k : int
+        Number of recommendations cached per user
+
+    succ : dict
+        Set of followed users for each user
+
+    pred : dict
+        Set of followers for each user
+
+    shared : dict
+        shared[u][v] is the number of users both u and v follow. Only nonzero
+        counts are stored.
+
+    top : dict
+        Cached list of (v, p) recommendations for each user, sorted by p in
+        descending order
+
+    Methods
+    -------
+    from_graph(G, k=10)
+        Build the counts and top k lists from a NetworkX graph.
+
+    add_edges(edges)
+        Add a batch of (u, v) edges and refresh the affected top k lists.
+
+    update_from_user_dict(user_dict)
+        Add any follower edges in a user_dict that haven't been seen yet.
+
+    score(u, v)
+        Current Jaccard coefficient of two users.
+
+    top_k(user)
+        Cached recommendations for a user.
+
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.succ = {}
+        self.pred = {}
+        self.shared = {}
+        self.top = {}
+
+    @classmethod
+    def from_graph(cls, G, k=10):
+        """Build the counts and top k lists from a NetworkX graph
+
+        Parameters
+        ----------
+        G : A NetworkX graph
+
+        k : int
+            Number of recommendations cached per user. Default value: 10
+
+        Returns
+        -------
+        scorer : IncrementalJaccard
+        """
+
+        scorer = cls(k=k)
+        scorer.add_edges(G.edges())
+        for node in G.nodes:
+            scorer._add_node(node)
+        return scorer
+
+    def _add_node(self, node):
+        if node not in self.succ:
+            self.succ[node] = set()
+            self.pred[node] = set()
+            self.shared[node] = {}
+            self.top[node] = []
+
+    def add_edges(self, edges):
+        """Add a batch of new follow edges and refresh the top k lists of every
+        user whose scores changed.
+
+        A new edge u -> w changes the shared count between u and each other
+        follower of w. It also changes u's out-degree, and with it the union
+        size between u and everyone who shares a neighbor with u. Those users
+        are the only ones whose lists get recomputed.
+
+        Parameters
+        ----------
+        edges : iterable of tuples
+            Tuples (u, v) where u is the user and v is someone they follow.
+            Edges that already exist are skipped.
+
+        Returns
+        -------
+        affected : set
+            Users whose top k lists were recomputed
+        """
+
+        changed_degree = set()
+        for u, w in edges:
+            self._add_node(u)
+            self._add_node(w)
+            if u == w or w in self.succ[u]:
+                continue
+            shared_u = self.shared[u]
+            for v in self.pred[w]:
+                shared_u[v] = shared_u.get(v, 0) + 1
+                shared_v = self.shared[v]
+                shared_v[u] = shared_v.get(u, 0) + 1
+            self.succ[u].add(w)
+            self.pred[w].add(u)
+            changed_degree.add(u)
+
+        affected = set(changed_degree)
+        for u in changed_degree:
+            affected.update(self.shared[u])
+        for user in affected:
+            self._refresh_top(user)
+        return affected
+
+    def update_from_user_dict(self, user_dict):
+        """Add any follower edges in a user_dict that haven't been seen yet,
+        e.g. after UserDict.get_users or update_users
+
+        Parameters
+        ----------
+        user_dict : dict
+            Dictionary with users as keys and followers as values in the
+            'followers' subkey
+
+        Returns
+        -------
+        affected : set
+            Users whose top k lists were recomputed
+        """
+
+        new_edges = []
+        for user in user_dict.keys():
+            followers = user_dict[user].get('followers', [])
+            known = self.pred.get(user, ())
+            for follower in followers:
+                if follower not in known:
+                    new_edges.append((follower, user))
+        return self.add_edges(new_edges)
+
+    def score(self, u, v):
+        """Current Jaccard coefficient of two users
+
+        Parameters
+        ----------
+        u, v : str
+            Usernames
+
+        Returns
+        -------
+        p : float
+        """
+
+        shared = self.shared.get(u, {}).get(v, 0)
+        if shared == 0:
+            return 0.0
+        return shared / (len(self.succ[u]) + len(self.succ[v]) - shared)
+
+    def _refresh_top(self, user):
+        followed = self.succ[user]
+        degree = len(followed)
+        succ = self.succ
+        scores = ((v, shared / (degree + len(succ[v]) - shared))
+                  for v, shared in self.shared[user].items()
+                  if v != user and v not in followed)
+        # Ties go to the lower username. The shared dicts are ordered by edge
+        # history, so recommend_top_k's first-found rule can't be reproduced.
+        self.top[user] = heapq.nsmallest(self.k, scores,
+                                         key=lambda x: (-x[1], x[0]))
+
+    def top_k(self, user):
+        """Cached recommendations for a user
+
+        Parameters
+        ----------
+        user : str
+            Username
+
+        Returns
+        -------
+        top_k_recs : list of tuples
+            (v, p) tuples sorted by p in descending order, then by username.
+            The scores match jaccard_recs.recommend_top_k, but users tied at
+            the cutoff can differ, since it keeps whichever it finds first.
+        """
+
+        return self.top.get(user, [])
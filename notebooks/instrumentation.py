@@ -0,0 +1,298 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_enabled = False
+_trace_memory = False
+_started_tracemalloc = False
+_origin = time.perf_counter()
+_events = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(trace_memory=False):
+    """Start recording stages
+
+    Parameters
+    ----------
+    trace_memory : bool
+        Also record each stage's memory high-water mark with tracemalloc.
+        This slows down pure Python code noticeably. Default value: False
+    """
+
+    global _enabled, _trace_memory, _started_tracemalloc
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+
+def disable():
+    """Stop recording stages. Events recorded so far are kept."""
+    global _enabled, _trace_memory, _started_tracemalloc
+    _enabled = False
+    _trace_memory = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop all recorded events"""
+    global _origin
+    with _lock:
+        _events.clear()
+    _origin = time.perf_counter()
+
+
+class _NoOpStage:
+    # Shared stand-in returned by stage() while recording is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def items(self):
+        return None
+
+    @items.setter
+    def items(self, value):
+        pass
+
+
+_NOOP = _NoOpStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'items', '_start', '_start_bytes', '_max_bytes')
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        if _trace_memory:
+            stack = _stack()
+            current, peak = tracemalloc.get_traced_memory()
+            # Hand the peak so far to the enclosing stage before resetting it
+            if stack:
+                stack[-1]._max_bytes = max(stack[-1]._max_bytes, peak)
+            tracemalloc.reset_peak()
+            self._start_bytes = current
+            self._max_bytes = current
+            stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        peak_bytes = None
+        if _trace_memory:
+            stack = _stack()
+            self._max_bytes = max(self._max_bytes,
+                                  tracemalloc.get_traced_memory()[1])
+            # Lazy stages from timed_iter can finish out of order
+            if self in stack:
+                stack.remove(self)
+            if stack:
+                stack[-1]._max_bytes = max(stack[-1]._max_bytes,
+                                           self._max_bytes)
+            peak_bytes = self._max_bytes - self._start_bytes
+
+        duration = end - self._start
+        event = {
+            'name': self.name,
+            'start': self._start - _origin,
+            'duration': duration,
+            'items': self.items,
+            'throughput': (self.items / duration
+                           if self.items is not None and duration > 0
+                           else None),
+            'peak_bytes': peak_bytes,
+            'maxrss_kb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                          if resource is not None else None),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def stage(name, items=None):
+    """Context manager that records one stage. Set .items on the returned
+    object inside the block if the count is only known at the end.
+
+    While recording is off this returns a shared no-op object, so hooks can
+    stay in place at the cost of one flag check.
+
+    Parameters
+    ----------
+    name : str
+        Stage name, e.g. 'jaccard_recs.edgelist_from_user_dict'
+
+    items : int, optional
+        Number of items processed, used for throughput. Default value: None
+
+    Example
+    -------
+        instrumentation.enable(trace_memory=True)
+        with instrumentation.stage('build edgelist') as s:
+            edges = jr.edgelist_from_user_dict(user_dict)
+            s.items = len(edges)
+        instrumentation.write_chrome_trace('trace.json')
+    """
+
+    if not _enabled:
+        return _NOOP
+    return _Stage(name, items)
+
+
+def timed_iter(name, iterable):
+    """Record a lazy iterator as one stage, from the first item until it is
+    exhausted, with the number of items it produced. Used for the scoring
+    generators, whose work happens while the caller iterates.
+
+    Parameters
+    ----------
+    name : str
+        Stage name
+
+    iterable : iterable
+
+    Returns
+    -------
+    iterator : iterator
+        The same items. While recording is off, iterable is returned as is.
+    """
+
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+
+def _timed_iter(name, iterable):
+    with _Stage(name, 0) as s:
+        for item in iterable:
+            s.items += 1
+            yield item
+
+
+def instrumented(name=None, items=None):
+    """Decorator that records every call of a function as a stage
+
+    Parameters
+    ----------
+    name : str, optional
+        Stage name. Defaults to module.function.
+
+    items : callable, optional
+        Function of the return value that gives the item count, e.g. len.
+        Default value: None
+    """
+
+    def decorator(func):
+        stage_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name, None) as s:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    s.items = items(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+# Scripts and scheduled scrapes can opt in without code changes:
+# TEA_RECS_PROFILE=1 records timings, TEA_RECS_PROFILE=memory adds memory
+if os.environ.get('TEA_RECS_PROFILE'):
+    enable(trace_memory=os.environ['TEA_RECS_PROFILE'] == 'memory')
+
+
+def events():
+    """Copy of every recorded event, in the order stages finished"""
+    with _lock:
+        return list(_events)
+
+
+def summary():
+    """Totals for each stage name
+
+    Returns
+    -------
+    stages : dict
+        Stage name as key and a dict with 'calls', 'total_seconds',
+        'items', 'throughput' and 'peak_bytes' (highest seen) as value
+    """
+
+    stages = {}
+    for event in events():
+        s = stages.setdefault(event['name'], {'calls': 0, 'total_seconds': 0.0,
+                                              'items': None, 'throughput': None,
+                                              'peak_bytes': None})
+        s['calls'] += 1
+        s['total_seconds'] += event['duration']
+        if event['items'] is not None:
+            s['items'] = (s['items'] or 0) + event['items']
+        if event['peak_bytes'] is not None:
+            s['peak_bytes'] = max(s['peak_bytes'] or 0, event['peak_bytes'])
+    for s in stages.values():
+        if s['items'] is not None and s['total_seconds'] > 0:
+            s['throughput'] = s['items'] / s['total_seconds']
+    return stages
+
+
+def write_log(path):
+    """Write every event as one JSON object per line"""
+    with open(path, 'w') as f:
+        for event in events():
+            f.write(json.dumps(event) + '\n')
+
+
+def write_chrome_trace(path):
+    """Write events in the Chrome trace format (chrome://tracing, Perfetto)"""
+    trace = []
+    for event in events():
+        trace.append({
+            'name': event['name'],
+            'ph': 'X',
+            'ts': event['start'] * 1e6,
+            'dur': event['duration'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'args': {key: event[key] for key in
+                     ('items', 'throughput', 'peak_bytes', 'maxrss_kb')},
+        })
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
@@ -3,9 +3,14 @@ import pickle
 import networkx.algorithms.community as nx_comm
 import networkx.algorithms.link_prediction as nx_lp
 import random
+import heapq
+import hashlib
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+from instrumentation import instrumented, timed_iter
+from parallel import process_pool, worker_state
 
+@instrumented(items=len)
 def import_user_dict(filepath):
     """Import user info dictionary
 
@@ -24,6 +29,7 @@ def import_user_dict(filepath):
         user_dict = pickle.load(p)
     return user_dict
 
+@instrumented(items=len)
 def edgelist_from_user_dict(user_dict):  
     """Create edgelist from user_dict
     
@@ -48,6 +54,7 @@ def edgelist_from_user_dict(user_dict):
     return edgelist
 
 
+@instrumented(items=lambda r: len(r[0]) + len(r[1]))
 def train_test_split_edgelist(edgelist, split_percent = .8):
     """Randomly samples the edgelist and splits into train and test data
     
@@ -66,8 +73,14 @@ def train_test_split_edgelist(edgelist, split_percent = .8):
 
     test_data : list of tuples
         Portion of edgelist set aside as holdout data for scoring predictions
+
+    Notes
+    -----
+    The caller's list is left as is; a shuffled copy is split. For seeded,
+    per-user splits over integer edge arrays see compact_graph.split_mask.
     """
 
+    edgelist = list(edgelist)
     random.shuffle(edgelist)
     train_data = edgelist[:int((len(edgelist)+1)*split_percent)]
     test_data = edgelist[int((len(edgelist)+1)*split_percent):]
@@ -75,7 +88,7 @@ def train_test_split_edgelist(edgelist, split_percent = .8):
     return train_data, test_data
 
 
-def jaccard_coefficient(G, ebunch=None):
+def jaccard_coefficient(G, ebunch=None, two_hop=False):
     """Randomly samples the edgelist and splits into train and test data. This
     is a copy of the 'jaccard_coefficient' function in NetworkX, which was not 
     set up for directed graphs when I started working on this.
@@ -91,6 +104,11 @@ def jaccard_coefficient(G, ebunch=None):
         then all non-existent edges in the graph will be used.
         Default value: None.
 
+    two_hop : bool
+        If True and ebunch is None, only score the pairs from two_hop_ebunch
+        instead of every non-existent edge. Pairs left out would all have a
+        coefficient of 0. Default value: False
+
 
     Returns
     -------
@@ -103,6 +121,13 @@ def jaccard_coefficient(G, ebunch=None):
     Wrap this function in a list() to assign an output to the function's output.
     """
 
+    # NetworkX walks ebunch once to check the nodes, so generators are
+    # materialized before they get there
+    if ebunch is None and two_hop:
+        ebunch = list(two_hop_ebunch(G))
+    elif ebunch is not None:
+        ebunch = list(ebunch)
+
     def predict(u, v):
         union_size = len(set(G[u]).union(set(G[v])))
         if union_size == 0:
@@ -110,27 +135,415 @@ def jaccard_coefficient(G, ebunch=None):
         shared = len(set(G[u]).intersection(set(G[v])))
         return shared / union_size
 
-    return nx_lp._apply_prediction(G, predict, ebunch)
+    return timed_iter('jaccard_recs.jaccard_coefficient',
+                      nx_lp._apply_prediction(G, predict, ebunch))
+
+
+def two_hop_candidates(G, user):
+    """Find the nodes that share at least one neighbor with a user. These are
+    the only nodes that can get a nonzero Jaccard coefficient with the user.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    user : str
+        Username from the user_dict or graph nodes
+
+    Returns
+    -------
+    candidates : set
+        Nodes v that also follow someone the user follows, not counting the
+        user and the nodes the user already follows
+
+    Example
+    -------
+    If 'jack' follows 'eric', and 'sylvia' also follows 'eric', then 'sylvia'
+    is a candidate for 'jack'.
+    """
+
+    followers = G.pred if G.is_directed() else G.adj
+    followed = G[user]
+    candidates = set()
+    for neighbor in followed:
+        candidates.update(followers[neighbor])
+    candidates.discard(user)
+    candidates.difference_update(followed)
+    return candidates
+
+
+def two_hop_ebunch(G, users=None):
+    """Generate the (u, v) pairs from two_hop_candidates for each user. Passing
+    this to jaccard_coefficient scores roughly the sum of squared degrees
+    instead of every one of the n² non-existent edges.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    users : iterable, optional
+        Source users to generate pairs for. If None, all nodes in G are used.
+        Default value: None
+
+    Returns
+    -------
+    ebunch : iterator
+        An iterator of 2-tuples (u, v) where u and v share a neighbor
+    """
+
+    if users is None:
+        users = G.nodes
+    for u in users:
+        for v in two_hop_candidates(G, u):
+            yield (u, v)
+
+
+def adjacency_matrix(G, nodelist=None):
+    """Build a binary CSR adjacency matrix from a graph
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    nodelist : list, optional
+        Node order for the rows and columns of the matrix. If None, the order
+        of G.nodes is used. Default value: None
+
+    Returns
+    -------
+    A : scipy.sparse.csr_array
+        Matrix where A[i, j] == 1 if nodelist[i] -> nodelist[j] is an edge
+
+    nodelist : list
+        Node order used for the rows and columns of A
+    """
+
+    if nodelist is None:
+        nodelist = list(G)
+    A = nx.to_scipy_sparse_array(G, nodelist=nodelist, weight=None,
+                                 dtype=np.int32, format='csr')
+    return A, nodelist
+
+
+def sparse_jaccard_coefficient(G, ebunch=None, two_hop=False):
+    """Sparse-matrix version of jaccard_coefficient. Intersection sizes for
+    every pair of nodes come from a single sparse product A·Aᵀ, and union sizes
+    are the sum of the two out-degrees minus the intersection.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    ebunch : iterable of node pairs, optional (default = None)
+        Jaccard coefficient will be computed for each pair of nodes
+        given in the iterable. The pairs must be given as 2-tuples
+        (u, v) where u and v are nodes in the graph. If ebunch is None
+        then all non-existent edges in the graph will be used.
+        Default value: None.
+
+    two_hop : bool
+        If True and ebunch is None, only yield pairs that share a neighbor,
+        which are the nonzero entries of A·Aᵀ. Default value: False
+
+    Returns
+    -------
+    piter : iterator
+        An iterator of 3-tuples in the form (u, v, p) where (u, v) is a
+        pair of nodes and p is their Jaccard coefficient.
+
+    Notes
+    -----
+    Returns the same (u, v, p) triples as jaccard_coefficient, so the output
+    can be passed straight to calculate_precision_at_k. Pairs come out grouped
+    by source node, but not necessarily in the same order.
+    """
+
+    A, nodelist = adjacency_matrix(G)
+    degrees = np.asarray(A.sum(axis=1)).ravel()
+    shared = (A @ A.T).tocsr()
+
+    if ebunch is not None:
+        index = {node: i for i, node in enumerate(nodelist)}
+        pairs = list(ebunch)
+        if len(pairs) == 0:
+            return iter([])
+        try:
+            rows = np.array([index[u] for u, v in pairs], dtype=np.int64)
+            cols = np.array([index[v] for u, v in pairs], dtype=np.int64)
+        except KeyError as e:
+            raise nx.NodeNotFound(f"Node {e.args[0]} not in G.")
+        inter = np.asarray(shared[rows, cols]).ravel()
+        union = degrees[rows] + degrees[cols] - inter
+        p = np.divide(inter, union, out=np.zeros(len(pairs)), where=union > 0)
+        return timed_iter('jaccard_recs.sparse_jaccard_coefficient',
+                          ((u, v, score)
+                           for (u, v), score in zip(pairs, p.tolist())))
+
+    def all_non_edges():
+        n = len(nodelist)
+        for i, u in enumerate(nodelist):
+            inter = shared[[i], :].toarray().ravel()
+            union = degrees[i] + degrees - inter
+            p = np.divide(inter, union, out=np.zeros(n), where=union > 0)
+            scores = p.tolist()
+            candidates = np.ones(n, dtype=bool)
+            candidates[A.indices[A.indptr[i]:A.indptr[i+1]]] = False
+            candidates[i] = False
+            for j in np.flatnonzero(candidates).tolist():
+                yield (u, nodelist[j], scores[j])
+
+    def shared_neighbor_pairs():
+        for i, u in enumerate(nodelist):
+            start, end = shared.indptr[i], shared.indptr[i+1]
+            cols = shared.indices[start:end]
+            inter = shared.data[start:end]
+            keep = cols != i
+            keep[np.isin(cols, A.indices[A.indptr[i]:A.indptr[i+1]])] = False
+            cols, inter = cols[keep], inter[keep]
+            p = inter / (degrees[i] + degrees[cols] - inter)
+            for j, score in zip(cols.tolist(), p.tolist()):
+                yield (u, nodelist[j], score)
+
+    if two_hop:
+        return timed_iter('jaccard_recs.sparse_jaccard_coefficient',
+                          shared_neighbor_pairs())
+    return timed_iter('jaccard_recs.sparse_jaccard_coefficient',
+                      all_non_edges())
+
+
+LINK_PREDICTION_METRICS = ('common_neighbors', 'jaccard', 'adamic_adar',
+                           'resource_allocation', 'cosine')
+
+
+@instrumented(items=lambda r: len(r[0]))
+def link_prediction_scores(G, users=None):
+    """Scores every two-hop candidate pair with several link-prediction
+    metrics from a single pass over the shared neighbors.
+
+    For a pair (u, v), the shared neighbors are the users both u and v
+    follow. Each shared neighbor w is weighted by its number of followers,
+    d(w), for Adamic-Adar (1 / log d(w)) and resource allocation (1 / d(w)).
+    Cosine is the shared count over sqrt(out-degree(u) * out-degree(v)).
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    users : iterable, optional
+        Source users to score. If None, all nodes in G are used.
+        Default value: None
+
+    Returns
+    -------
+    pairs : list of tuples
+        (u, v) pairs that share at least one neighbor. Nodes u already follows
+        are left out.
+
+    scores : numpy.ndarray
+        Array of shape (len(pairs), len(LINK_PREDICTION_METRICS)). Column i
+        holds the metric named LINK_PREDICTION_METRICS[i].
+    """
+
+    if users is None:
+        users = G.nodes
+    followers = G.pred if G.is_directed() else G.adj
+
+    pairs = []
+    rows = []
+    for u in users:
+        followed = G[u]
+        u_degree = len(followed)
+        sums = {}
+        for w in followed:
+            w_followers = followers[w]
+            w_degree = len(w_followers)
+            # Anyone reached through w shares it with u, so w_degree >= 2
+            if w_degree < 2:
+                continue
+            aa = 1 / np.log(w_degree)
+            ra = 1 / w_degree
+            for v in w_followers:
+                acc = sums.get(v)
+                if acc is None:
+                    sums[v] = [1, aa, ra]
+                else:
+                    acc[0] += 1
+                    acc[1] += aa
+                    acc[2] += ra
+
+        for v, (shared, aa, ra) in sums.items():
+            if v == u or v in followed:
+                continue
+            v_degree = len(G[v])
+            pairs.append((u, v))
+            rows.append((shared,
+                         shared / (u_degree + v_degree - shared),
+                         aa,
+                         ra,
+                         shared / np.sqrt(u_degree * v_degree)))
+
+    scores = np.array(rows, dtype=float).reshape(-1, len(LINK_PREDICTION_METRICS))
+    return pairs, scores
+
+
+def metric_coefficients(pairs, scores, metric='jaccard'):
+    """Pick one metric from link_prediction_scores as a list of (u,v,p)
+    tuples, so it can go through calculate_precision_at_k like the output of
+    jaccard_coefficient.
+
+    Parameters
+    ----------
+    pairs : list of tuples
+        (u, v) pairs from link_prediction_scores
+
+    scores : numpy.ndarray
+        Score array from link_prediction_scores
 
+    metric : str
+        One of LINK_PREDICTION_METRICS. Default value: 'jaccard'
 
-# Didn't end up using this because it gives all 1.0 and 0.0 coefficients
-def community_jaccard_coefficients(G, community_lists):
-    """Creates subgraphs of each detected community. This function doesn't work.
-    I think it's because the subgraphs subdivide the graph so much that there 
-    are very few following/follower nodes remaining. There might be other issues
-    as well.
+    Returns
+    -------
+    coefficients_list : list of tuples
+        Unsorted list of (u,v,p) tuples
+    """
+
+    column = scores[:, LINK_PREDICTION_METRICS.index(metric)].tolist()
+    return [(u, v, p) for (u, v), p in zip(pairs, column)]
+
+
+# Louvain partitions, keyed by graph fingerprint and seed
+_community_cache = {}
+
+
+def graph_fingerprint(G):
+    """Hash of a graph's nodes and edges, used to tell if cached results
+    (e.g. communities) still match the graph
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    Returns
+    -------
+    fingerprint : str
+        SHA-1 hex digest of the sorted node and edge lists
     """
 
-    num_comms = len(community_lists)
-    G_all_jcs = []
-    for i in range(1,num_comms+1):
-        cluster_comm = [n for n,v in G.nodes(data=True) if v['community'] == i]
-        G_cluster = nx.subgraph(G, nbunch=cluster_comm)
-        G_cluster_jc = jaccard_coefficient(G_cluster)
-        G_all_jcs.append(list(G_cluster_jc))
+    digest = hashlib.sha1()
+    for node in sorted(map(str, G.nodes)):
+        digest.update(node.encode('utf-8') + b'\n')
+    digest.update(b'\n')
+    for u, v in sorted((str(u), str(v)) for u, v in G.edges):
+        digest.update(u.encode('utf-8') + b'\t' + v.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+@instrumented(items=len)
+def louvain_communities(G, seed=123, cache_path=None):
+    """Louvain communities of a graph, cached between calls
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+        Directed graphs are partitioned as undirected.
+
+    seed : int
+        Random seed for Louvain. Default value: 123
+
+    cache_path : str, optional
+        Pickle file that keeps the partitions between sessions. If None,
+        communities are only cached in memory. Default value: None
+
+    Returns
+    -------
+    communities : list of sets
+        One set of nodes per community
+    """
+
+    key = (graph_fingerprint(G), seed)
+    if key in _community_cache:
+        return _community_cache[key]
+
+    disk_cache = {}
+    if cache_path is not None and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as p:
+            disk_cache = pickle.load(p)
+
+    if key in disk_cache:
+        communities = disk_cache[key]
+    else:
+        communities = nx_comm.louvain_communities(G.to_undirected(), seed=seed)
+        if cache_path is not None:
+            disk_cache[key] = communities
+            with open(cache_path, 'wb') as p:
+                pickle.dump(disk_cache, p)
+
+    _community_cache[key] = communities
+    return communities
+
+
+def _init_community_worker(G):
+    worker_state['G'] = G
+
+
+def _worker_community_coefficients(users):
+    G = worker_state['G']
+    return list(jaccard_coefficient(G, ebunch=two_hop_ebunch(G, users)))
+
+
+@instrumented(items=lambda r: sum(map(len, r)))
+def community_jaccard_coefficients(G, community_lists=None, seed=123,
+                                   n_jobs=1, cache_path=None):
+    """Jaccard coefficients computed one community at a time.
+
+    Communities are only used to split up the source users. Every user's
+    neighborhood still comes from the full graph, so the scores are exactly
+    the same as jaccard_coefficient(G, two_hop=True). Users in the same
+    community share most of their neighbors, so each shard works on a small,
+    cache-friendly part of the graph, and shards can run in parallel.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    community_lists : list of iterables, optional
+        Nodes in each community. If None, Louvain communities from
+        louvain_communities are used. Default value: None
+
+    seed : int
+        Random seed for Louvain. Default value: 123
+
+    n_jobs : int
+        Number of worker processes. Use -1 for one per CPU. Default value: 1
+
+    cache_path : str, optional
+        Pickle file for caching Louvain communities between runs.
+        Default value: None
+
+    Returns
+    -------
+    G_all_jcs : list of lists
+        One list of (u, v, p) tuples per community, for the pairs whose
+        source user u is in that community
+    """
+
+    if community_lists is None:
+        community_lists = louvain_communities(G, seed=seed,
+                                              cache_path=cache_path)
+    shards = [list(community) for community in community_lists]
+
+    if n_jobs == 1:
+        return [list(jaccard_coefficient(G, ebunch=two_hop_ebunch(G, users)))
+                for users in shards]
+
+    pool, _ = process_pool(n_jobs, _init_community_worker, (G,))
+    with pool:
+        G_all_jcs = pool.map(_worker_community_coefficients, shards)
     return G_all_jcs
 
 
+@instrumented(items=len)
 def sort_jaccard_coefficients(coefficients_list, user='jack'):
     """Sort list of (u,v,p) tuples by p in descending order.
 
@@ -169,7 +582,8 @@ def get_top_n(sorted_list, G, n=10):
     Returns
     -------
     top_n_recs : list
-        List of usernames to recommend to specific user
+        List of usernames to recommend to specific user. This is shorter than
+        n if sorted_list runs out, e.g. when it only holds two-hop candidates.
     """
 
     top_n_recs = []
@@ -180,6 +594,66 @@ def get_top_n(sorted_list, G, n=10):
                 top_n_recs.append(row[1])
         else:
             return top_n_recs
+    return top_n_recs
+
+
+@instrumented(items=len)
+def recommend_top_k(G, users=None, k=10):
+    """Top k Jaccard recommendations for each user, without building the full
+    list of coefficients.
+
+    Shared-neighbor counts are gathered one user at a time from the two-hop
+    candidates, and each score goes through a heap that never holds more than
+    k entries. Nodes the user already follows are never scored.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    users : iterable, optional
+        Users to recommend for. If None, all nodes in G are used.
+        Default value: None
+
+    k : int
+        Number of recommendations per user. Default value: 10
+
+    Returns
+    -------
+    top_k_recs : dict
+        Dictionary with username as key and a list of (v, p) tuples sorted by
+        p in descending order as value. Lists can be shorter than k when a user
+        has fewer than k two-hop candidates, and are empty when k < 1.
+    """
+
+    if users is None:
+        users = G.nodes
+    if k < 1:
+        return {u: [] for u in users}
+    followers = G.pred if G.is_directed() else G.adj
+
+    top_k_recs = {}
+    for u in users:
+        followed = G[u]
+        u_degree = len(followed)
+        shared_counts = {}
+        for neighbor in followed:
+            for v in followers[neighbor]:
+                shared_counts[v] = shared_counts.get(v, 0) + 1
+
+        heap = []
+        for order, (v, shared) in enumerate(shared_counts.items()):
+            if v == u or v in followed:
+                continue
+            p = shared / (u_degree + len(G[v]) - shared)
+            # Ties keep the candidate that was found first
+            item = (p, -order, v)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif heap and item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        top_k_recs[u] = [(v, p) for p, _, v in sorted(heap, reverse=True)]
+    return top_k_recs
 
 
 def calc_correct_preds(top_n_recs, user, test_data):
@@ -239,10 +713,79 @@ def calc_preds_precision(top_n_recs, user, test_data):
     correct_preds = calc_correct_preds(top_n_recs, user, test_data)
     total_correct = len(correct_preds)  # true positives
     total_preds = len(top_n_recs)  # true positives + false positives
+    if total_preds == 0:
+        return 0.0
     precision = total_correct/total_preds
     return precision
 
 
+@instrumented(items=len)
+def index_jaccard_coefficients(coefficients_list):
+    """Group (u,v,p) tuples by source user and sort each group by p in
+    descending order. This does in one pass what sort_jaccard_coefficients
+    does for a single user.
+
+    Parameters
+    ----------
+    coefficients_list : list of tuples
+        Unsorted list of (u,v,p) tuples
+
+    Returns
+    -------
+    coefficient_index : dict
+        Dictionary with username as key and value is the sorted list of that
+        user's (u,v,p) tuples, same as sort_jaccard_coefficients would return.
+    """
+
+    coefficient_index = {}
+    for tup in coefficients_list:
+        coefficient_index.setdefault(tup[0], []).append(tup)
+    for user_jcs in coefficient_index.values():
+        user_jcs.sort(key=lambda x: x[2], reverse=True)
+    return coefficient_index
+
+
+def precision_curve(user_jcs_sorted, G, user, test_index, k=50):
+    """Calculates precision at every level from 1 to k for one user. The top k
+    recommendations are picked once, and precision at each level comes from a
+    cumulative sum of the hits.
+
+    Parameters
+    ----------
+    user_jcs_sorted : list of tuples
+        Sorted list of (u,v,p) tuples for the user
+
+    G : A NetworkX graph
+
+    user : str
+        Username from the user_dict or graph nodes
+
+    test_index : set of tuples
+        Holdout (u, v) edges. A set makes each lookup O(1).
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    Returns
+    -------
+    p_at_k_user : list
+        Precision at each level of k, same as calling get_top_n and
+        calc_preds_precision for k = 1, 2, ..., k
+    """
+
+    top_k_recs = get_top_n(user_jcs_sorted, G, n=k)
+    hits = np.fromiter(((user, item) in test_index for item in top_k_recs),
+                       dtype=np.int64, count=len(top_k_recs))
+    # Past the end of a short list, get_top_n keeps returning the whole list
+    total_preds = np.minimum(np.arange(1, k+1), len(top_k_recs))
+    total_correct = np.zeros(k)
+    if len(top_k_recs) > 0:
+        total_correct = np.cumsum(hits)[total_preds-1].astype(float)
+    precision = np.divide(total_correct, total_preds, out=np.zeros(k),
+                          where=total_preds > 0)
+    return precision.tolist()
+
+
 def get_random_node_sample(G, n=100, seed=123):
     """Return a random sample of nodes for evaluation
 
@@ -263,20 +806,22 @@ def get_random_node_sample(G, n=100, seed=123):
     """
 
     random.seed(seed)
-    random_users = random.sample(G.nodes, n)
+    random_users = random.sample(list(G.nodes), n)
     return random_users
 
 
+@instrumented(items=lambda r: len(r[0]))
 def calculate_precision_at_k(G, jaccard_coefficients_list, test_data, H,
-                             H_threshold, n=100, k=50, seed=123):
+                             H_threshold, n=100, k=50, seed=123, n_jobs=1):
     """Calculates precision at k recommendations
 
     Parameters
     ----------
     G : A NetworkX graph
 
-    jaccard_coefficients_list : list of tuples
-        Unsorted list of (u,v,p) tuples
+    jaccard_coefficients_list : list of tuples or dict
+        Unsorted list of (u,v,p) tuples, or the output of
+        index_jaccard_coefficients if it has already been built
     
     test_data : list of tuples
         Portion of edgelist set aside as holdout data for scoring predictions
@@ -298,6 +843,12 @@ def calculate_precision_at_k(G, jaccard_coefficients_list, test_data, H,
     seed : int
         Random seed. Default value: 123
 
+    n_jobs : int
+        Number of worker processes. Use -1 for one per CPU. The graph, test set
+        and coefficient index are handed to each worker once when the pool
+        starts, not with every user. Results are the same and in the same
+        order as with n_jobs=1. Default value: 1
+
     Returns
     -------
     p_at_k_all : list of lists
@@ -313,56 +864,256 @@ def calculate_precision_at_k(G, jaccard_coefficients_list, test_data, H,
     
     random_users = get_random_node_sample(G, n=n, seed=seed)
 
-    p_at_k_all = []
+    if isinstance(jaccard_coefficients_list, dict):
+        coefficient_index = jaccard_coefficients_list
+    else:
+        coefficient_index = index_jaccard_coefficients(jaccard_coefficients_list)
+    test_index = set(test_data)
 
-    p_at_k_dict = {}
+    eval_users = [user for user in random_users
+                  if H.out_degree(user) >= H_threshold]
 
-    for user in random_users:
-        if H.out_degree(user) >= H_threshold:
-            p_at_k_user = []
-            user_jcs_sorted = sort_jaccard_coefficients(jaccard_coefficients_list,
-                                                        user=user)
-            for k in range(1,k+1):
-                user_top_n = get_top_n(user_jcs_sorted, G, n=k)
-                precision = calc_preds_precision(user_top_n, user, test_data)
-                p_at_k_user.append(precision)
-            p_at_k_all.append(p_at_k_user)
-            p_at_k_dict[user] = p_at_k_user
+    if n_jobs == 1:
+        p_at_k_all = [precision_curve(coefficient_index.get(user, []), G, user,
+                                      test_index, k=k)
+                      for user in eval_users]
+    else:
+        p_at_k_all = parallel_precision_curves(eval_users, G, coefficient_index,
+                                               test_index, k=k, n_jobs=n_jobs)
+
+    p_at_k_dict = dict(zip(eval_users, p_at_k_all))
 
     return p_at_k_all, p_at_k_dict
 
 
-def calculate_avg_precision_at_k(p_at_k_all):
-    """Calculates average precision at k for all users at each level k
+def _init_precision_worker(G, coefficient_index, test_index, k):
+    worker_state['G'] = G
+    worker_state['coefficient_index'] = coefficient_index
+    worker_state['test_index'] = test_index
+    worker_state['k'] = k
+
+
+def _worker_precision_curve(user):
+    return precision_curve(worker_state['coefficient_index'].get(user, []),
+                           worker_state['G'], user,
+                           worker_state['test_index'], k=worker_state['k'])
+
+
+def parallel_precision_curves(users, G, coefficient_index, test_index, k=50,
+                              n_jobs=-1):
+    """Calculates precision_curve for each user on a pool of processes
+
+    Parameters
+    ----------
+    users : list
+        Users to evaluate
+
+    G : A NetworkX graph
+
+    coefficient_index : dict
+        Output of index_jaccard_coefficients
+
+    test_index : set of tuples
+        Holdout (u, v) edges
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    n_jobs : int
+        Number of worker processes. Use -1 for one per CPU. Default value: -1
+
+    Returns
+    -------
+    p_at_k_all : list of lists
+        Precision curve for each user, in the same order as users
+
+    Notes
+    -----
+    On Linux workers are forked and inherit G, the index and the test set
+    from the parent without pickling. Elsewhere (macOS, Windows) they are
+    pickled once per worker by the pool initializer, never once per task.
+    """
+
+    pool, n_jobs = process_pool(n_jobs, _init_precision_worker,
+                                 (G, coefficient_index, test_index, k))
+    chunksize = max(1, len(users) // (n_jobs * 4))
+    with pool:
+        p_at_k_all = pool.map(_worker_precision_curve, users,
+                              chunksize=chunksize)
+    return p_at_k_all
+
+
+@instrumented()
+def precision_at_k_threshold_sweep(G, jaccard_coefficients_list, test_data, H,
+                                   thresholds, n=100, k=50, seed=123,
+                                   n_jobs=1):
+    """Calculates precision at k for several out-degree thresholds in one run.
+    Each sampled user is scored once at the lowest threshold, then put into
+    every threshold bucket their out-degree clears. Each bucket's results are
+    the same as calling calculate_precision_at_k with that H_threshold.
+
+    Parameters
+    ----------
+    G : A NetworkX graph
+
+    jaccard_coefficients_list : list of tuples or dict
+        Unsorted list of (u,v,p) tuples, or the output of
+        index_jaccard_coefficients
+
+    test_data : list of tuples
+        Portion of edgelist set aside as holdout data for scoring predictions
+
+    H : A NetworkX graph
+        The full graph (not split into train/test), used for out-degrees
+
+    thresholds : list of int
+        Values of H_threshold to evaluate, e.g. [1, 5, 10, 20]
+
+    n : int
+        Number of nodes to sample. Default value: 100
+
+    k : int
+        Number of recommendations to provide. Default value: 50
+
+    seed : int
+        Random seed. Default value: 123
+
+    n_jobs : int
+        Number of worker processes, see calculate_precision_at_k.
+        Default value: 1
+
+    Returns
+    -------
+    sweep : dict
+        Dictionary with each threshold as key. Each value is a dict with
+        'p_at_k_all' and 'p_at_k_dict' (same as calculate_precision_at_k),
+        'avg_p_at_k' (mean precision at each level of k), 'n_users' (users
+        that cleared the threshold) and 'coverage' (n_users / n).
+    """
+
+    H = nx.DiGraph(H)
+    _, scored = calculate_precision_at_k(G, jaccard_coefficients_list,
+                                         test_data, H, min(thresholds), n=n,
+                                         k=k, seed=seed, n_jobs=n_jobs)
+    out_degrees = {user: H.out_degree(user) for user in scored}
+
+    sweep = {}
+    for threshold in sorted(thresholds):
+        p_at_k_dict = {user: p_at_k_user for user, p_at_k_user in scored.items()
+                       if out_degrees[user] >= threshold}
+        p_at_k_all = list(p_at_k_dict.values())
+        avg_p_at_k, _ = average_precision_curves(p_at_k_all)
+        sweep[threshold] = {
+            'p_at_k_all': p_at_k_all,
+            'p_at_k_dict': p_at_k_dict,
+            'avg_p_at_k': avg_p_at_k,
+            'n_users': len(p_at_k_all),
+            'coverage': len(p_at_k_all) / n,
+        }
+    return sweep
+
+
+def average_precision_curves(p_at_k_all):
+    """Averages precision at each level of k over users, without plotting.
+    Curves can have different lengths: each level is averaged over the users
+    whose curve reaches it.
 
     Parameters
     ----------
     p_at_k_all : list of lists
         List of lists where each sublist corresponds to a user n and each
         element of the sublist represents precision at each level of k.
-    
+
     Returns
     -------
-    avg_p_at_k_all : list
-        List where each element of sublists of p_at_k_all have been averaged
-    
-    Notes
-    -----
-    This function also produces a precision at k (p@k) chart
+    avg_p_at_k : numpy.ndarray
+        Mean precision at each level of k, as long as the longest curve
+
+    n_users_at_k : numpy.ndarray
+        Number of users averaged at each level of k
+    """
+
+    lengths = np.fromiter((len(p) for p in p_at_k_all), dtype=np.int64,
+                          count=len(p_at_k_all))
+    max_k = int(lengths.max()) if len(lengths) else 0
+    mask = np.arange(max_k) < lengths[:, None]
+    padded = np.zeros(mask.shape)
+    if mask.any():
+        padded[mask] = np.concatenate([np.asarray(p, dtype=float)
+                                       for p in p_at_k_all])
+    n_users_at_k = mask.sum(axis=0)
+    avg_p_at_k = np.divide(padded.sum(axis=0), n_users_at_k,
+                           out=np.zeros(max_k), where=n_users_at_k > 0)
+    return avg_p_at_k, n_users_at_k
+
+
+def plot_precision_at_k(avg_p_at_k, n_users, path=None, title=None):
+    """Draws a precision at k (p@k) chart
+
+    Parameters
+    ----------
+    avg_p_at_k : array-like
+        Mean precision at each level of k
+
+    n_users : int
+        Number of users averaged, used in the default title
+
+    path : str, optional
+        Image file to write, e.g. '../images/precision_at_k_threshold1.png'.
+        The chart is drawn without a display, so this works on servers. If
+        None, the chart is shown with pyplot instead. Default value: None
+
+    title : str, optional
+        Chart title. Default value: 'Precision at k for <n_users> random users'
     """
 
-    avg_p_at_k_all = np.mean(p_at_k_all, axis=0)
+    # Imported here so scoring and evaluation never load matplotlib
+    if path is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(7,4))
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(7,4))
+    ax = fig.add_subplot()
+
+    x = np.arange(1, len(avg_p_at_k)+1)
+    ax.plot(x, avg_p_at_k)
+    ax.set_xlabel('k')
+    ax.set_xticks(np.arange(0, len(x)+1, step=1))
+    ax.set_ylabel('Precision')
+    ax.set_title(title or f'Precision at k for {n_users} random users')
+    fig.tight_layout()
+
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+
+
+@instrumented()
+def calculate_avg_precision_at_k(p_at_k_all, plot=True, path=None):
+    """Calculates average precision at k for all users at each level k
 
-    x = [i for i in range(1,len(avg_p_at_k_all)+1)]
-    y = avg_p_at_k_all
+    Parameters
+    ----------
+    p_at_k_all : list of lists
+        List of lists where each sublist corresponds to a user n and each
+        element of the sublist represents precision at each level of k.
+
+    plot : bool
+        Draw a precision at k (p@k) chart. Default value: True
 
-    fig, ax = plt.subplots(figsize=(7,4))
-    plt.plot(x, y)
-    plt.xlabel('k')
-    plt.xticks(np.arange(0, len(x)+1, step=1))
-    plt.ylabel('Precision')
-    plt.title(f'Precision at k for {len(p_at_k_all)} random users')
-    plt.tight_layout()
-    plt.show()
+    path : str, optional
+        Write the chart to this file instead of showing it, see
+        plot_precision_at_k. Default value: None
     
-    return avg_p_at_k_all
\ No newline at end of file
+    Returns
+    -------
+    avg_p_at_k_all : numpy.ndarray
+        Precision at each level of k averaged over the users that reach it
+    """
+
+    avg_p_at_k_all, _ = average_precision_curves(p_at_k_all)
+    if plot:
+        plot_precision_at_k(avg_p_at_k_all, len(p_at_k_all), path=path)
+    return avg_p_at_k_all
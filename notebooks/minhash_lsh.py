@@ -0,0 +1,352 @@
+import random
+import numpy as np
+import jaccard_recs as jr
+
+# Hash values are (a*x + b) mod this prime, which keeps a*x inside int64
+_PRIME = (1 << 31) - 1
+
+
+def bands_for_threshold(num_perm, threshold):
+    """Pick the number of LSH bands whose threshold is closest to a target.
+
+    A pair with Jaccard coefficient s becomes a candidate with probability
+    1 - (1 - s**r)**b for b bands of r rows, and the S-curve is steepest near
+    (1/b)**(1/r). Lower thresholds find more pairs (better recall) but put
+    more nodes in each bucket (slower lookups).
+
+    Parameters
+    ----------
+    num_perm : int
+        Number of MinHash permutations. Only band counts that divide it
+        evenly are considered.
+
+    threshold : float
+        Target Jaccard coefficient between 0 and 1
+
+    Returns
+    -------
+    bands : int
+        Number of bands to use
+    """
+
+    options = [b for b in range(1, num_perm+1) if num_perm % b == 0]
+    return min(options,
+               key=lambda b: abs((1/b)**(b/num_perm) - threshold))
+
+
+class MinHashLSH:
+    """
+    An approximate Jaccard index for large follow graphs. Each user's set of
+    followed users is compressed to a MinHash signature, and signatures are
+    split into bands that are hashed into buckets. Users that land in the same
+    bucket in any band are candidate neighbors.
+
+    ...
+
+    Attributes
+    ----------
+    num_perm : int
+        Length of each MinHash signature
+
+    bands : int
+        Number of LSH bands. Each band has num_perm / bands rows.
+
+    nodelist : list
+        Node order of the signature rows, set by fit()
+
+    signatures : numpy.ndarray
+        Array of shape (len(nodelist), num_perm) with one signature per node,
+        set by fit()
+
+    Methods
+    -------
+    fit(G)
+        Build the signatures and the banding index for a graph.
+
+    candidates(user)
+        Users that share a bucket with the user in at least one band.
+
+    estimate(u, v)
+        Estimated Jaccard coefficient of two users.
+
+    query(user, n=10)
+        Top n estimated neighbors of a user who they don't already follow.
+
+    approx_jaccard_coefficient(users=None)
+        (u, v, p) tuples for every candidate pair, like jaccard_coefficient.
+
+    estimate_error(sample_size=100, seed=123)
+        Compare estimated and exact coefficients for a sample of users.
+
+    """
+
+    def __init__(self, num_perm=128, bands=32, threshold=None, seed=123):
+        """
+        Parameters
+        ----------
+        num_perm : int
+            Length of each MinHash signature. More permutations give better
+            estimates but take longer to build. Default value: 128
+
+        bands : int
+            Number of LSH bands. Must divide num_perm. More bands find more
+            pairs (higher recall) but make each lookup slower.
+            Default value: 32
+
+        threshold : float, optional
+            If given, bands is chosen with bands_for_threshold so that pairs
+            above this Jaccard coefficient are likely to be found.
+            Default value: None
+
+        seed : int
+            Random seed for the hash functions. Default value: 123
+        """
+
+        if threshold is not None:
+            bands = bands_for_threshold(num_perm, threshold)
+        if num_perm % bands != 0:
+            raise ValueError(f"bands ({bands}) must divide num_perm "
+                             f"({num_perm})")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+
+        self.G = None
+        self.nodelist = []
+        self.signatures = None
+
+    @property
+    def threshold(self):
+        """Approximate Jaccard coefficient where pairs start to be found"""
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def fit(self, G, block_size=16):
+        """Build the signatures and the banding index for a graph
+
+        Parameters
+        ----------
+        G : A NetworkX graph
+
+        block_size : int
+            Number of hash functions applied at once. Peak memory is about
+            block_size x number of edges x 8 bytes. Default value: 16
+
+        Returns
+        -------
+        self : MinHashLSH
+        """
+
+        A, nodelist = jr.adjacency_matrix(G)
+        self.G = G
+        self.nodelist = nodelist
+        self._index = {node: i for i, node in enumerate(nodelist)}
+        self._degrees = np.diff(A.indptr)
+
+        n = len(nodelist)
+        non_empty = np.flatnonzero(self._degrees > 0)
+        starts = A.indptr[:-1][non_empty]
+        columns = A.indices.astype(np.int64)
+
+        # Nodes with no neighbors keep the sentinel and are left out of buckets
+        signatures = np.full((n, self.num_perm), _PRIME, dtype=np.int64)
+        for lo in range(0, self.num_perm, block_size):
+            hi = min(lo + block_size, self.num_perm)
+            hashed = ((self._a[lo:hi, None] * columns[None, :]
+                       + self._b[lo:hi, None]) % _PRIME)
+            if len(non_empty) > 0:
+                mins = np.minimum.reduceat(hashed, starts, axis=1)
+                signatures[non_empty, lo:hi] = mins.T
+        self.signatures = signatures.astype(np.uint32)
+
+        self._build_buckets(non_empty)
+        return self
+
+    def _build_buckets(self, non_empty):
+        # One 64-bit key per node per band; each band is stored as its keys
+        # sorted once, so a lookup is a binary search plus the bucket size
+        self._bands = []
+        self._positions = np.full(len(self.nodelist), -1, dtype=np.int64)
+        self._positions[non_empty] = np.arange(len(non_empty))
+        sigs = self.signatures[non_empty].astype(np.uint64)
+        for band in range(self.bands):
+            block = sigs[:, band*self.rows:(band+1)*self.rows]
+            keys = np.zeros(len(non_empty), dtype=np.uint64)
+            for col in range(self.rows):
+                keys = keys * np.uint64(1000003) + block[:, col]
+            order = np.argsort(keys, kind='stable')
+            self._bands.append((keys[order], non_empty[order], keys))
+
+    def _candidate_indices(self, i):
+        if self._degrees[i] == 0:
+            return np.empty(0, dtype=np.int64)
+        found = []
+        for sorted_keys, members, keys in self._bands:
+            key = keys[self._positions[i]]
+            lo = np.searchsorted(sorted_keys, key, side='left')
+            hi = np.searchsorted(sorted_keys, key, side='right')
+            found.append(members[lo:hi])
+        found = np.unique(np.concatenate(found))
+        return found[found != i]
+
+    def candidates(self, user):
+        """Users that share a bucket with the user in at least one band
+
+        Parameters
+        ----------
+        user : str
+            Username from the graph nodes
+
+        Returns
+        -------
+        candidates : list
+            Candidate usernames, not including the user
+        """
+
+        i = self._index[user]
+        return [self.nodelist[j] for j in self._candidate_indices(i).tolist()]
+
+    def estimate(self, u, v):
+        """Estimated Jaccard coefficient of two users
+
+        Parameters
+        ----------
+        u, v : str
+            Usernames from the graph nodes
+
+        Returns
+        -------
+        p : float
+            Fraction of signature positions where the two users agree
+        """
+
+        i, j = self._index[u], self._index[v]
+        if self._degrees[i] == 0 or self._degrees[j] == 0:
+            return 0.0
+        return float(np.mean(self.signatures[i] == self.signatures[j]))
+
+    def _estimates(self, i, js):
+        return np.mean(self.signatures[js] == self.signatures[i], axis=1)
+
+    def query(self, user, n=10):
+        """Top n estimated neighbors of a user who they don't already follow
+
+        Parameters
+        ----------
+        user : str
+            Username from the graph nodes
+
+        n : int
+            Number of recommendations to provide. Default value: 10
+
+        Returns
+        -------
+        top_n_recs : list of tuples
+            (v, p) tuples sorted by estimated p in descending order
+        """
+
+        i = self._index[user]
+        js = self._candidate_indices(i)
+        followed = self.G[user]
+        js = np.array([j for j in js.tolist()
+                       if self.nodelist[j] not in followed], dtype=np.int64)
+        if len(js) == 0:
+            return []
+        p = self._estimates(i, js)
+        order = np.argsort(-p, kind='stable')[:n]
+        return [(self.nodelist[j], p_j)
+                for j, p_j in zip(js[order].tolist(), p[order].tolist())]
+
+    def approx_jaccard_coefficient(self, users=None):
+        """Estimated coefficients for every candidate pair. The output has the
+        same (u, v, p) form as jaccard_coefficient, so it can be passed to
+        calculate_precision_at_k.
+
+        Parameters
+        ----------
+        users : iterable, optional
+            Source users. If None, all nodes are used. Default value: None
+
+        Returns
+        -------
+        piter : iterator
+            An iterator of 3-tuples (u, v, p) where p is the estimated
+            Jaccard coefficient of u and v
+        """
+
+        if users is None:
+            users = self.nodelist
+        for u in users:
+            i = self._index[u]
+            followed = self.G[u]
+            js = self._candidate_indices(i)
+            if len(js) == 0:
+                continue
+            p = self._estimates(i, js)
+            for j, p_j in zip(js.tolist(), p.tolist()):
+                v = self.nodelist[j]
+                if v not in followed:
+                    yield (u, v, p_j)
+
+    def estimate_error(self, sample_size=100, seed=123):
+        """Compare estimated and exact coefficients for a sample of users.
+
+        For each sampled user, every two-hop candidate (the pairs that can
+        have a nonzero coefficient) gets an exact score. Error is measured on
+        those pairs, and recall is the share of pairs at or above the index
+        threshold that LSH also returns as candidates.
+
+        Parameters
+        ----------
+        sample_size : int
+            Number of users to sample. Default value: 100
+
+        seed : int
+            Random seed. Default value: 123
+
+        Returns
+        -------
+        report : dict
+            'pairs', 'mean_abs_error', 'rmse', 'max_abs_error', 'threshold',
+            'recall_above_threshold' and 'candidates_per_user'
+        """
+
+        random.seed(seed)
+        users = [u for u in self.nodelist if self._degrees[self._index[u]] > 0]
+        users = random.sample(users, min(sample_size, len(users)))
+
+        errors = []
+        above_threshold = 0
+        found = 0
+        candidate_counts = []
+        for u in users:
+            i = self._index[u]
+            lsh_candidates = set(self._candidate_indices(i).tolist())
+            candidate_counts.append(len(lsh_candidates))
+            ebunch = [(u, v) for v in jr.two_hop_candidates(self.G, u)]
+            for _, v, exact in jr.jaccard_coefficient(self.G, ebunch):
+                j = self._index[v]
+                estimate = float(np.mean(self.signatures[i]
+                                         == self.signatures[j]))
+                errors.append(estimate - exact)
+                if exact >= self.threshold:
+                    above_threshold += 1
+                    found += j in lsh_candidates
+
+        errors = np.array(errors)
+        report = {
+            'pairs': len(errors),
+            'mean_abs_error': float(np.mean(np.abs(errors))) if len(errors) else 0.0,
+            'rmse': float(np.sqrt(np.mean(errors**2))) if len(errors) else 0.0,
+            'max_abs_error': float(np.max(np.abs(errors))) if len(errors) else 0.0,
+            'threshold': self.threshold,
+            'recall_above_threshold': (found / above_threshold
+                                       if above_threshold else None),
+            'candidates_per_user': (float(np.mean(candidate_counts))
+                                    if candidate_counts else 0.0),
+        }
+        return report
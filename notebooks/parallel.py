@@ -0,0 +1,51 @@
+import multiprocessing as mp
+import os
+import sys
+
+# Shared state for worker processes, set once per worker by the pool
+# initializer so large arguments aren't sent with every task
+worker_state = {}
+
+
+def init_worker(state):
+    """Pool initializer that copies a dict of shared state into worker_state"""
+    worker_state.update(state)
+
+
+def process_pool(n_jobs, initializer=init_worker, initargs=(),
+                 start_method=None):
+    """Process pool whose workers each receive the shared state once, through
+    the initializer, rather than with every task
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of worker processes. Use -1 for one per CPU.
+
+    initializer : callable
+        Run once in each worker with initargs. Default value: init_worker
+
+    initargs : tuple
+        Default value: ()
+
+    start_method : str, optional
+        'fork', 'spawn' or 'forkserver'. If None, 'fork' is used on Linux,
+        where workers then inherit initargs without pickling, and the
+        platform default everywhere else. macOS defaults to 'spawn' because
+        forking a process that has loaded numpy and scipy can crash the
+        children. Default value: None
+
+    Returns
+    -------
+    pool : multiprocessing.pool.Pool
+
+    n_jobs : int
+        Number of workers, with -1 resolved
+    """
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if start_method is None and sys.platform.startswith('linux'):
+        start_method = 'fork'
+    ctx = mp.get_context(start_method)
+    return ctx.Pool(n_jobs, initializer=initializer, initargs=initargs), n_jobs
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import pickle
+import numpy as np
+import scipy.sparse as sp
+from instrumentation import instrumented
+
+# Reviews scraped without a rating are stored with this score by get_reviews
+NO_RATING = 1000
+
+# Ratings tables, keyed by SHA-1 of the source file
+_ratings_cache = {}
+
+
+class Ratings:
+    """
+    Every review in a tea_dict as flat arrays, with user and item ID maps and
+    a sparse users x items ratings matrix. Reviews without a rating (weight
+    NO_RATING) are kept, but flagged and left out of the matrix.
+
+    ...
+
+    Attributes
+    ----------
+    users : list of str
+        Reviewer for each user ID, in order of first review
+
+    items : list of str
+        Tea ID for each item ID, in tea_dict order
+
+    review_user, review_item : numpy.ndarray
+        int32 user and item ID of each review, in tea_dict order
+
+    review_weight : numpy.ndarray
+        int32 score of each review as scraped
+
+    rated : numpy.ndarray
+        Boolean, False for reviews with no rating
+
+    Methods
+    -------
+    user_ids, item_ids
+        Dicts from reviewer / tea ID to row / column.
+
+    matrix
+        scipy.sparse.csr_array of rated scores, shape (users, items).
+
+    unrated
+        scipy.sparse.csr_array, True where a user reviewed a tea without a
+        rating.
+
+    to_frame(include_unrated=False)
+        DataFrame with 'user', 'item' and 'rating' columns for Surprise.
+
+    """
+
+    def __init__(self, users, items, review_user, review_item, review_weight):
+        self.users = list(users)
+        self.items = list(items)
+        self.review_user = np.asarray(review_user, dtype=np.int32)
+        self.review_item = np.asarray(review_item, dtype=np.int32)
+        self.review_weight = np.asarray(review_weight, dtype=np.int32)
+        self.rated = self.review_weight != NO_RATING
+        self._user_ids = None
+        self._item_ids = None
+        self._matrix = None
+
+    def __len__(self):
+        return len(self.review_weight)
+
+    @property
+    def user_ids(self):
+        if self._user_ids is None:
+            self._user_ids = {user: i for i, user in enumerate(self.users)}
+        return self._user_ids
+
+    @property
+    def item_ids(self):
+        if self._item_ids is None:
+            self._item_ids = {item: j for j, item in enumerate(self.items)}
+        return self._item_ids
+
+    @property
+    def shape(self):
+        return len(self.users), len(self.items)
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            rated = self.rated
+            self._matrix = sp.csr_array(
+                (self.review_weight[rated].astype(np.float32),
+                 (self.review_user[rated], self.review_item[rated])),
+                shape=self.shape)
+        return self._matrix
+
+    @property
+    def unrated(self):
+        unrated = ~self.rated
+        return sp.csr_array(
+            (np.ones(unrated.sum(), dtype=bool),
+             (self.review_user[unrated], self.review_item[unrated])),
+            shape=self.shape)
+
+    def to_frame(self, include_unrated=False):
+        """Reviews as a DataFrame with 'user', 'item' and 'rating' columns,
+        in tea_dict order, ready for surprise.Dataset.load_from_df
+
+        Parameters
+        ----------
+        include_unrated : bool
+            Keep reviews with no rating, with NO_RATING as the rating.
+            Default value: False
+        """
+
+        import pandas as pd
+
+        keep = slice(None) if include_unrated else self.rated
+        users = np.array(self.users, dtype=object)
+        items = np.array(self.items, dtype=object)
+        return pd.DataFrame({
+            'user': users[self.review_user[keep]],
+            'item': items[self.review_item[keep]],
+            'rating': self.review_weight[keep],
+        })
+
+    def save(self, path):
+        """Write the tables to one .npz file. Strings are stored as fixed-width
+        unicode arrays, so nothing is pickled."""
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, users=np.array(self.users, dtype=str),
+                     items=np.array(self.items, dtype=str),
+                     review_user=self.review_user,
+                     review_item=self.review_item,
+                     review_weight=self.review_weight)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['users'].tolist(), data['items'].tolist(),
+                       data['review_user'], data['review_item'],
+                       data['review_weight'])
+
+
+@instrumented(items=len)
+def build_ratings(tea_dict):
+    """Build the ratings tables in one pass over a tea_dict
+
+    Parameters
+    ----------
+    tea_dict : dict
+        Tea dictionary from TeaDict, plain or as records.Tea
+
+    Returns
+    -------
+    ratings : Ratings
+    """
+
+    user_ids = {}
+    review_user = []
+    review_item = []
+    review_weight = []
+    for item, tea in enumerate(tea_dict.values()):
+        reviewers = tea.get('reviewers')
+        if not reviewers:
+            continue
+        if hasattr(reviewers, 'weights'):
+            weights = reviewers.weights()
+        else:
+            weights = [(reviewer, review['weight'])
+                       for reviewer, review in reviewers.items()]
+        for reviewer, weight in weights:
+            review_user.append(user_ids.setdefault(reviewer, len(user_ids)))
+            review_item.append(item)
+            review_weight.append(weight)
+    return Ratings(user_ids.keys(), tea_dict.keys(), review_user, review_item,
+                   review_weight)
+
+
+def load_ratings(filepath='../data/pickled-data/tea_dict.p', cache_dir=None):
+    """Ratings for a pickled tea_dict, cached by the file's SHA-1 so repeated
+    model runs skip unpickling and rebuilding
+
+    Parameters
+    ----------
+    filepath : str
+        Pickled tea_dict. Default value: '../data/pickled-data/tea_dict.p'
+
+    cache_dir : str, optional
+        Directory for ratings-<sha1>.npz files that keep the tables between
+        sessions. If None, ratings are only cached in memory.
+        Default value: None
+
+    Returns
+    -------
+    ratings : Ratings
+    """
+
+    with open(filepath, 'rb') as p:
+        source = p.read()
+    key = hashlib.sha1(source).hexdigest()
+    if key in _ratings_cache:
+        return _ratings_cache[key]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f'ratings-{key}.npz')
+
+    if cache_path is not None and os.path.exists(cache_path):
+        ratings = Ratings.load(cache_path)
+    else:
+        ratings = build_ratings(pickle.loads(source))
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            ratings.save(cache_path)
+
+    _ratings_cache[key] = ratings
+    return ratings
@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import json
+import pickle
+import time
+import traceback
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, unquote, urlsplit
+import networkx as nx
+import numpy as np
+import jaccard_recs as jr
+from ratings import NO_RATING
+from records import Reviews
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with a fixed number of entries
+
+    ...
+
+    Attributes
+    ----------
+    maxsize : int
+        Number of entries kept before the oldest is evicted
+
+    hits, misses, evictions : int
+        Running counters for the stats endpoint
+
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'size': len(self), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class LatencyCounter:
+    """
+    Keeps the most recent request latencies and reports percentiles
+
+    ...
+
+    Attributes
+    ----------
+    count : int
+        Total number of requests recorded
+
+    """
+
+    def __init__(self, window=10000):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def stats(self):
+        if not self._samples:
+            return {'count': 0, 'p50_ms': None, 'p99_ms': None}
+        p50, p99 = np.percentile(np.fromiter(self._samples, dtype=float),
+                                 [50, 99])
+        return {'count': self.count, 'p50_ms': float(p50) * 1000,
+                'p99_ms': float(p99) * 1000}
+
+
+class _Batcher:
+    # Collects cold misses for a short window and computes them together
+    def __init__(self, compute, window, max_batch):
+        self.compute = compute
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._task = None
+
+    async def submit(self, user, n):
+        loop = asyncio.get_running_loop()
+        key = (user, n)
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = loop.create_future()
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._task is None:
+            self._task = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        loop = asyncio.get_running_loop()
+        users = [user for user, _ in pending]
+        n = max(n for _, n in pending)
+        try:
+            results = await loop.run_in_executor(None, self.compute, users, n)
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (user, user_n), future in pending.items():
+            if not future.done():
+                future.set_result(results.get(user, [])[:user_n])
+
+
+def tea_recommender_from_tea_dict(tea_dict, min_reviews=1):
+    """Simple ratings recommender for the service: the highest average-rated
+    teas a user hasn't reviewed yet. Unrated reviews (NO_RATING) are ignored.
+
+    Parameters
+    ----------
+    tea_dict : dict
+        Tea dictionary from TeaDict, with reviews in the 'reviewers' subkey.
+        Tea records from records.load_teas are read without building a dict
+        per review.
+
+    min_reviews : int
+        Minimum number of rated reviews for a tea to be recommended.
+        Default value: 1
+
+    Returns
+    -------
+    recommend : callable
+        recommend(users, n) returns a dict with each user as key and a list of
+        (tea_id, score) tuples as value
+    """
+
+    averages = []
+    reviewed = {}
+    for tea_id, tea in tea_dict.items():
+        reviewers = tea.get('reviewers', {})
+        if isinstance(reviewers, Reviews):
+            weights = reviewers.weights()
+        else:
+            weights = [(reviewer, review['weight'])
+                       for reviewer, review in reviewers.items()]
+        ratings = [weight for _, weight in weights if weight != NO_RATING]
+        for reviewer, _ in weights:
+            reviewed.setdefault(reviewer, set()).add(tea_id)
+        if len(ratings) >= min_reviews:
+            averages.append((tea_id, sum(ratings) / len(ratings)))
+    averages.sort(key=lambda x: x[1], reverse=True)
+
+    def recommend(users, n):
+        recs = {}
+        for user in users:
+            seen = reviewed.get(user, set())
+            user_recs = []
+            for tea_id, score in averages:
+                if tea_id not in seen:
+                    user_recs.append((tea_id, score))
+                    if len(user_recs) == n:
+                        break
+            recs[user] = user_recs
+        return recs
+
+    return recommend
+
+
+class RecService:
+    """
+    Small asyncio HTTP service for follow and tea recommendations.
+
+    Endpoints
+    ---------
+    GET /follow/<user>?n=10
+        Jaccard follow recommendations from recommend_top_k
+
+    GET /tea/<user>?n=10
+        Tea recommendations from the ratings recommender
+
+    GET /stats
+        Cache counters and p50/p99 latency for each endpoint
+
+    Results are cached in an LRU keyed by (endpoint, user, n, graph_version),
+    so set_graph() makes every old entry unreachable and they age out. Cold
+    misses that arrive within batch_window seconds of each other are computed
+    in a single batch in a worker thread.
+
+    ...
+
+    Attributes
+    ----------
+    G : A NetworkX graph
+        Follow graph used for follow recommendations
+
+    graph_version : int
+        Incremented by set_graph()
+
+    cache : LRUCache
+
+    latency : dict
+        LatencyCounter for each endpoint
+
+    Methods
+    -------
+    set_graph(G)
+        Swap in a new follow graph.
+
+    follow_recs(user, n=10)
+        Follow recommendations for a user (coroutine).
+
+    tea_recs(user, n=10)
+        Tea recommendations for a user (coroutine).
+
+    serve(host='127.0.0.1', port=8080)
+        Run the HTTP server until cancelled (coroutine).
+
+    """
+
+    def __init__(self, G, tea_recommender=None, cache_size=10000,
+                 batch_window=0.005, max_batch=256):
+        """
+        Parameters
+        ----------
+        G : A NetworkX graph
+
+        tea_recommender : callable, optional
+            recommend(users, n) -> {user: [(tea_id, score), ...]}, e.g. from
+            tea_recommender_from_tea_dict. If None, /tea returns 404.
+            Default value: None
+
+        cache_size : int
+            Number of cached results. Default value: 10000
+
+        batch_window : float
+            Seconds to wait for more cold misses before computing a batch.
+            Default value: 0.005
+
+        max_batch : int
+            Largest batch of users computed at once. Default value: 256
+        """
+
+        self.G = G
+        self.graph_version = 0
+        self.tea_recommender = tea_recommender
+        self.cache = LRUCache(cache_size)
+        self.latency = {'follow': LatencyCounter(), 'tea': LatencyCounter()}
+        self._batchers = {
+            'follow': _Batcher(self._compute_follow, batch_window, max_batch),
+            'tea': _Batcher(self._compute_tea, batch_window, max_batch),
+        }
+
+    def set_graph(self, G):
+        """Swap in a new follow graph, e.g. after a scrape"""
+        self.G = G
+        self.graph_version += 1
+
+    def _compute_follow(self, users, n):
+        G = self.G
+        users = [user for user in users if user in G]
+        return jr.recommend_top_k(G, users=users, k=n)
+
+    def _compute_tea(self, users, n):
+        return self.tea_recommender(users, n)
+
+    async def _cached(self, endpoint, user, n):
+        key = (endpoint, user, n, self.graph_version)
+        recs = self.cache.get(key)
+        if recs is None:
+            recs = await self._batchers[endpoint].submit(user, n)
+            self.cache.put(key, recs)
+        return recs
+
+    async def follow_recs(self, user, n=10):
+        return await self._cached('follow', user, n)
+
+    async def tea_recs(self, user, n=10):
+        return await self._cached('tea', user, n)
+
+    def stats(self):
+        return {
+            'graph_version': self.graph_version,
+            'cache': self.cache.stats(),
+            'latency': {name: counter.stats()
+                        for name, counter in self.latency.items()},
+        }
+
+    async def _route(self, path, query):
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['stats']:
+            return 200, self.stats()
+        if len(parts) != 2 or parts[0] not in self._batchers:
+            return 404, {'error': 'not found'}
+        endpoint, user = parts
+        n = int(query.get('n', ['10'])[0])
+        if n < 1:
+            return 400, {'error': 'n must be at least 1'}
+        if endpoint == 'tea' and self.tea_recommender is None:
+            return 404, {'error': 'no tea recommender loaded'}
+
+        start = time.perf_counter()
+        if endpoint == 'follow':
+            recs = await self.follow_recs(user, n)
+            body = [{'user': v, 'score': p} for v, p in recs]
+        else:
+            recs = await self.tea_recs(user, n)
+            body = [{'tea_id': tea_id, 'score': p} for tea_id, p in recs]
+        self.latency[endpoint].record(time.perf_counter() - start)
+        return 200, {'user': user, 'recommendations': body}
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            except ValueError:
+                status, body = 400, {'error': 'bad request'}
+            else:
+                if method != 'GET':
+                    status, body = 405, {'error': 'method not allowed'}
+                else:
+                    url = urlsplit(target)
+                    try:
+                        status, body = await self._route(url.path,
+                                                         parse_qs(url.query))
+                    except ValueError:
+                        status, body = 400, {'error': 'bad request'}
+                    except Exception:
+                        traceback.print_exc()
+                        status, body = 500, {'error': 'internal error'}
+            payload = json.dumps(body).encode('utf-8')
+            reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                      405: 'Method Not Allowed',
+                      500: 'Internal Server Error'}[status]
+            writer.write(f'HTTP/1.1 {status} {reason}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(payload)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1')
+                         + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """Run the HTTP server until cancelled"""
+        server = await asyncio.start_server(self._handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def _fetch(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+async def load_test(host, port, paths, concurrency=10):
+    """Send GET requests to a running service and measure client-side latency
+
+    Parameters
+    ----------
+    host : str
+
+    port : int
+
+    paths : list of str
+        Request paths, e.g. ['/follow/jack', '/tea/jack']
+
+    concurrency : int
+        Number of requests in flight at once. Default value: 10
+
+    Returns
+    -------
+    report : dict
+        'requests', 'seconds', 'requests_per_second', 'p50_ms' and 'p99_ms'
+    """
+
+    queue = deque(paths)
+    latencies = []
+
+    async def worker():
+        while queue:
+            path = queue.popleft()
+            start = time.perf_counter()
+            await _fetch(host, port, path)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0, 0)
+    return {'requests': len(latencies), 'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds if seconds else 0,
+            'p50_ms': float(p50) * 1000, 'p99_ms': float(p99) * 1000}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve recommendations')
+    parser.add_argument('--user-dict', default='../data/pickled-data/user_dict.p')
+    parser.add_argument('--tea-dict', default='../data/pickled-data/tea_dict.p')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    user_dict = jr.import_user_dict(args.user_dict)
+    G = nx.DiGraph(jr.edgelist_from_user_dict(user_dict))
+    with open(args.tea_dict, 'rb') as p:
+        tea_dict = pickle.load(p)
+
+    service = RecService(G, tea_recommender_from_tea_dict(tea_dict))
+    print(f'Serving on http://{args.host}:{args.port}')
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,324 @@
+import bisect
+import os
+import struct
+import numpy as np
+import jaccard_recs as jr
+
+# Version 2 pads rec_ids to 8 bytes; version 1 files could leave rec_scores
+# only 4-byte aligned
+_MAGIC = b'TEARECS2'
+# magic, number of users, recommendations per user, size of the name blob
+_HEADER = struct.Struct('<8sQQQ')
+
+
+def pad(size, alignment=8):
+    """Number of zero bytes to write after size bytes so the next section
+    starts on an alignment boundary"""
+    return (alignment - size % alignment) % alignment
+
+
+def encode_strings(strings):
+    """Encode strings, in the given order, as an offsets array and one blob
+
+    Parameters
+    ----------
+    strings : iterable of str
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        uint64 array of length len(strings) + 1. String i is
+        blob[offsets[i]:offsets[i+1]].
+
+    blob : bytes
+        All strings encoded as UTF-8, back to back
+    """
+
+    encoded = [str(s).encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded)+1, dtype=np.uint64)
+    np.cumsum(np.fromiter((len(e) for e in encoded), dtype=np.uint64,
+                          count=len(encoded)), out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+class StringColumn:
+    """
+    Read-only list of strings stored as UTF-8 bytes plus an offset array,
+    usually both memory-mapped, in whatever order they were written. Supports
+    len() and indexing; use NameTable for a sorted column that can be
+    searched.
+
+    ...
+
+    Attributes
+    ----------
+    offsets : numpy.ndarray
+        uint64 array of length len(column) + 1. String i is
+        blob[offsets[i]:offsets[i+1]].
+
+    blob : numpy.ndarray
+        uint8 array with every string's UTF-8 bytes back to back
+
+    Methods
+    -------
+    tolist()
+        Decode the whole column into a list of str.
+
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self._keys = _EncodedNames(self)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self._keys[i].decode('utf-8')
+
+    def tolist(self):
+        # Decode the blob in one go instead of one memoryview slice at a time
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [blob[offsets[i]:offsets[i+1]].decode('utf-8')
+                for i in range(len(self))]
+
+
+class NameTable(StringColumn):
+    """
+    Read-only, sorted table of usernames stored as UTF-8 bytes plus an offset
+    array, usually both memory-mapped. Supports len(), indexing and lookups by
+    binary search, so nothing has to be decoded or hashed up front.
+
+    ...
+
+    Attributes
+    ----------
+    offsets : numpy.ndarray
+        uint64 array of length len(table) + 1. Name i is
+        blob[offsets[i]:offsets[i+1]].
+
+    blob : numpy.ndarray
+        uint8 array with every name's UTF-8 bytes back to back, sorted
+
+    Methods
+    -------
+    encode(names)
+        Build the offsets and blob for a list of names (sorted by bytes).
+
+    index(name)
+        Position of a name in the table, or -1 if it isn't there.
+
+    """
+
+    @staticmethod
+    def encode(names):
+        """Build the sorted offsets and blob arrays for a list of names
+
+        Parameters
+        ----------
+        names : iterable of str
+
+        Returns
+        -------
+        sorted_names : list of str
+            Names in table order (sorted by UTF-8 bytes)
+
+        offsets : numpy.ndarray
+            uint64 offsets into blob
+
+        blob : bytes
+            All names encoded back to back
+        """
+
+        sorted_names = sorted((str(name) for name in names),
+                              key=lambda name: name.encode('utf-8'))
+        offsets, blob = encode_strings(sorted_names)
+        return sorted_names, offsets, blob
+
+    def index(self, name):
+        """Position of a name in the table, or -1 if it isn't there"""
+        key = str(name).encode('utf-8')
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self) and self._keys[i] == key:
+            return i
+        return -1
+
+
+class _EncodedNames:
+    # Sequence of raw string bytes, so bisect compares bytes without decoding
+    def __init__(self, table):
+        # Plain memoryviews index much faster than numpy scalars
+        self.offsets = memoryview(table.offsets).cast('B').cast('Q')
+        self.blob = memoryview(table.blob).cast('B')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes()
+
+
+def save_array(path, array):
+    """np.save to path + '.tmp', then rename, so readers never see a
+    half-written file"""
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+
+def save_strings(prefix, strings):
+    """Store strings, in the given order, as <prefix>.offsets.npy (uint64) and
+    <prefix>.blob.npy (uint8), readable with load_strings"""
+    offsets, blob = encode_strings(strings)
+    save_array(prefix + '.offsets.npy', offsets)
+    save_array(prefix + '.blob.npy', np.frombuffer(blob, dtype=np.uint8))
+
+
+def load_strings(prefix, mmap_mode='r'):
+    """Open strings written by save_strings as a StringColumn
+
+    Parameters
+    ----------
+    prefix : str
+
+    mmap_mode : str, optional
+        Passed to numpy.load. Use None to read everything into memory.
+        Default value: 'r'
+    """
+
+    return StringColumn(np.load(prefix + '.offsets.npy', mmap_mode=mmap_mode),
+                        np.load(prefix + '.blob.npy', mmap_mode=mmap_mode))
+
+
+def build_rec_store(path, G, n=10, users=None):
+    """Write every user's top n recommendations and scores to one binary file.
+
+    Recommendations come from recommend_top_k, so like get_top_n, users
+    someone already follows are never recommended to them.
+
+    File layout (little-endian, every section 8-byte aligned):
+        header       magic, number of users, n, size of the name blob
+        offsets      uint64[number of users + 1]
+        names        UTF-8 bytes of the sorted usernames
+        rec_ids      int32[number of users, n], -1 where a list is short
+        rec_scores   float32[number of users, n]
+
+    Parameters
+    ----------
+    path : str
+        File to write. It is written to path + '.tmp' first and then renamed,
+        so readers never see a half-written file.
+
+    G : A NetworkX graph
+
+    n : int
+        Number of recommendations per user. Default value: 10
+
+    users : iterable, optional
+        Users to store recommendations for. Every node still goes in the name
+        table. If None, all nodes get recommendations. Default value: None
+    """
+
+    names, offsets, blob = NameTable.encode(G.nodes)
+    index = {name: i for i, name in enumerate(names)}
+
+    rec_ids = np.full((len(names), n), -1, dtype=np.int32)
+    rec_scores = np.zeros((len(names), n), dtype=np.float32)
+    top_k_recs = jr.recommend_top_k(G, users=users, k=n)
+    for user, recs in top_k_recs.items():
+        row = index[str(user)]
+        for col, (v, p) in enumerate(recs):
+            rec_ids[row, col] = index[str(v)]
+            rec_scores[row, col] = p
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(names), n, len(blob)))
+        f.write(offsets.tobytes())
+        f.write(blob)
+        f.write(b'\0' * pad(len(blob)))
+        f.write(rec_ids.tobytes())
+        f.write(b'\0' * pad(rec_ids.nbytes))
+        f.write(rec_scores.tobytes())
+    os.replace(tmp_path, path)
+
+
+class RecStore:
+    """
+    Memory-mapped reader for files written by build_rec_store. Opening a
+    store only maps the file; each lookup is a binary search over the name
+    table plus one row read, with nothing unpickled.
+
+    ...
+
+    Attributes
+    ----------
+    names : NameTable
+        Sorted usernames in the store
+
+    n : int
+        Number of recommendation slots per user
+
+    Methods
+    -------
+    recommendations(user)
+        Top n (username, score) tuples for a user.
+
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            File written by build_rec_store
+        """
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, num_users, n, blob_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a recommendation store")
+        self.n = n
+
+        pos = _HEADER.size
+        offsets = self._mm[pos:pos + 8*(num_users+1)].view(np.uint64)
+        pos += 8*(num_users+1)
+        blob = self._mm[pos:pos + blob_size]
+        pos += blob_size + pad(blob_size)
+        self._rec_ids = (self._mm[pos:pos + 4*num_users*n]
+                         .view(np.int32).reshape(num_users, n))
+        pos += 4*num_users*n + pad(4*num_users*n)
+        self._rec_scores = (self._mm[pos:pos + 4*num_users*n]
+                            .view(np.float32).reshape(num_users, n))
+        self.names = NameTable(offsets, blob)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, user):
+        return self.names.index(user) >= 0
+
+    def recommendations(self, user):
+        """Top n recommendations for a user
+
+        Parameters
+        ----------
+        user : str
+            Username
+
+        Returns
+        -------
+        top_n_recs : list of tuples
+            (username, score) tuples sorted by score in descending order. Empty
+            if the user isn't in the store.
+        """
+
+        row = self.names.index(user)
+        if row < 0:
+            return []
+        ids = self._rec_ids[row]
+        scores = self._rec_scores[row]
+        return [(self.names[j], float(p))
+                for j, p in zip(ids.tolist(), scores.tolist()) if j >= 0]
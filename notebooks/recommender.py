@@ -1,36 +1,37 @@
-import pickle
-import pandas as pd
 from surprise import BaselineOnly, Dataset
 from surprise import Reader
 from surprise import SVD, KNNBasic
 from surprise import NormalPredictor
 from surprise.model_selection import cross_validate
-
-with open("../data/pickled-data/tea_dict.p", 'rb') as p:
-    tea_dict = pickle.load(p)
-
-# print(tea_dict['Forever Nuts'])
-
-ratings = []
-
-for tea in tea_dict.keys():
-    for tea_char in tea_dict[tea].keys():
-        if tea_char == 'reviewers':
-            for reviewer in tea_dict[tea][tea_char].keys():
-                ratings.append((reviewer, tea, tea_dict[tea][tea_char][reviewer]['weight']))
-
-df = pd.DataFrame(ratings, columns=['user', 'item', 'rating'])
+import instrumentation
+from instrumentation import stage
+from ratings import load_ratings
+
+# Reviews without a rating (NO_RATING) are left out; the ratings tables are
+# cached by the pickle's hash, so reruns skip unpickling and rebuilding them
+with stage('recommender.load_ratings') as s:
+    ratings = load_ratings("../data/pickled-data/tea_dict.p",
+                           cache_dir="../data/cache")
+    df = ratings.to_frame()
+    s.items = len(df)
 
 reader = Reader(rating_scale=(0,100))
 
-data = Dataset.load_from_df(df[['user', 'item', 'rating']], reader)
+with stage('recommender.load_dataset', items=len(df)):
+    data = Dataset.load_from_df(df[['user', 'item', 'rating']], reader)
 
-murph = cross_validate(NormalPredictor(), data, cv=2)
+with stage('recommender.cross_validate.NormalPredictor'):
+    murph = cross_validate(NormalPredictor(), data, cv=2)
 
-cross_validate(BaselineOnly(), data, cv=2, verbose=True)
+with stage('recommender.cross_validate.BaselineOnly'):
+    cross_validate(BaselineOnly(), data, cv=2, verbose=True)
 
-cross_validate(SVD(), data, cv=2)
+with stage('recommender.cross_validate.SVD'):
+    cross_validate(SVD(), data, cv=2)
 
-cross_validate(KNNBasic(), data, cv=2)
+with stage('recommender.cross_validate.KNNBasic'):
+    cross_validate(KNNBasic(), data, cv=2)
 
+if instrumentation.is_enabled():
+    instrumentation.write_chrome_trace('recommender_trace.json')
 
@@ -0,0 +1,258 @@
+import pickle
+import sys
+from collections.abc import MutableMapping
+
+
+class _Record(MutableMapping):
+    # Dict-style access to the fields in __slots__, so code written for the
+    # nested dicts keeps working. A field that was never set is a missing key.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+class User(_Record):
+    """
+    One user_dict entry. Behaves like the old {'follower_count': ...,
+    'followers': [...]} dict, including 'followers' not being a key until it
+    has been set.
+
+    ...
+
+    Attributes
+    ----------
+    follower_count, follower_pgs, following_count, following_pgs : int
+
+    followers : list of str
+        Usernames, interned so each name is stored once across all lists
+    """
+
+    __slots__ = ('follower_count', 'follower_pgs', 'following_count',
+                 'following_pgs', 'followers')
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+
+class Reviews(MutableMapping):
+    """
+    A tea's reviews as one flat {reviewer: weight} dict instead of a dict per
+    review. Reading reviews[reviewer] returns a new {'weight': n} dict for
+    old code; assign a whole {'weight': n} dict (or an int) to change one.
+
+    ...
+
+    Methods
+    -------
+    weights()
+        (reviewer, weight) pairs without building any dicts.
+    """
+
+    __slots__ = ('_weights',)
+
+    def __init__(self, reviews=None):
+        self._weights = {}
+        if reviews:
+            for reviewer, review in reviews.items():
+                self[reviewer] = review
+
+    def __getitem__(self, reviewer):
+        return {'weight': self._weights[reviewer]}
+
+    def __setitem__(self, reviewer, review):
+        weight = review['weight'] if isinstance(review, dict) else review
+        self._weights[sys.intern(reviewer)] = weight
+
+    def __delitem__(self, reviewer):
+        del self._weights[reviewer]
+
+    def __iter__(self):
+        return iter(self._weights)
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, reviewer):
+        return reviewer in self._weights
+
+    def __repr__(self):
+        return f'Reviews({self._weights!r})'
+
+    def __getstate__(self):
+        return self._weights
+
+    def __setstate__(self, state):
+        self._weights = state
+
+    def weights(self):
+        return self._weights.items()
+
+
+class Tea(_Record):
+    """
+    One tea_dict entry. Behaves like the old tea dict, with 'reviewers' held
+    as a Reviews table.
+
+    ...
+
+    Attributes
+    ----------
+    name, url : str
+
+    brand : str
+        Interned, since most brands have many teas
+
+    rating, review_pages : int
+
+    reviewers : Reviews
+
+    flavors : list of str
+        Interned, since the same few hundred flavors repeat across teas
+
+    Methods
+    -------
+    review_weights()
+        (reviewer, weight) pairs, empty if the tea has no reviews.
+    """
+
+    __slots__ = ('name', 'brand', 'url', 'rating', 'review_pages',
+                 'reviewers', 'flavors')
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    def __setitem__(self, key, value):
+        if key == 'reviewers' and not isinstance(value, Reviews):
+            value = Reviews(value)
+        elif key == 'brand':
+            value = sys.intern(value)
+        elif key == 'flavors' and value is not None:
+            value = [sys.intern(flavor) for flavor in value]
+        super().__setitem__(key, value)
+
+    def review_weights(self):
+        try:
+            return self.reviewers.weights()
+        except AttributeError:
+            return ()
+
+
+def users_from_dict(user_dict):
+    """Convert a nested user_dict into User records
+
+    Parameters
+    ----------
+    user_dict : dict
+        Dictionary with users as keys, e.g. the unpickled user_dict.p
+
+    Returns
+    -------
+    users : dict
+        Same keys, with a User as each value
+    """
+
+    users = {}
+    for name, user_info in user_dict.items():
+        user = User()
+        for key, value in user_info.items():
+            if key == 'followers':
+                value = [sys.intern(follower) for follower in value]
+            user[key] = value
+        users[sys.intern(name)] = user
+    return users
+
+
+def teas_from_dict(tea_dict):
+    """Convert a nested tea_dict into Tea records
+
+    Parameters
+    ----------
+    tea_dict : dict
+        Dictionary with tea IDs as keys, e.g. the unpickled tea_dict.p
+
+    Returns
+    -------
+    teas : dict
+        Same keys, with a Tea as each value
+    """
+
+    return {tea_id: Tea(**tea) for tea_id, tea in tea_dict.items()}
+
+
+def to_plain(records):
+    """Nested plain dicts equal to the records, in the original pickle format,
+    for pickling or for code that needs real dicts
+
+    Parameters
+    ----------
+    records : dict
+        Output of users_from_dict or teas_from_dict
+
+    Returns
+    -------
+    plain : dict
+    """
+
+    plain = {}
+    for key, record in records.items():
+        entry = dict(record)
+        if isinstance(entry.get('reviewers'), Reviews):
+            entry['reviewers'] = {reviewer: {'weight': weight} for reviewer, weight
+                                  in entry['reviewers'].weights()}
+        if 'followers' in entry:
+            entry['followers'] = list(entry['followers'])
+        if 'flavors' in entry and entry['flavors'] is not None:
+            entry['flavors'] = list(entry['flavors'])
+        plain[key] = entry
+    return plain
+
+
+def load_users(filepath='../data/pickled-data/user_dict.p'):
+    """Unpickle a user_dict straight into User records"""
+    with open(filepath, 'rb') as p:
+        return users_from_dict(pickle.load(p))
+
+
+def load_teas(filepath='../data/pickled-data/tea_dict.p'):
+    """Unpickle a tea_dict straight into Tea records"""
+    with open(filepath, 'rb') as p:
+        return teas_from_dict(pickle.load(p))
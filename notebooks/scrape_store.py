@@ -0,0 +1,336 @@
+import os
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    follower_count INTEGER,
+    follower_pgs INTEGER,
+    following_count INTEGER,
+    following_pgs INTEGER,
+    has_followers INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS followers (
+    user TEXT NOT NULL,
+    follower TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS followers_user ON followers (user);
+CREATE TABLE IF NOT EXISTS all_urls (
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS teas (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    brand TEXT,
+    url TEXT,
+    rating INTEGER,
+    review_pages INTEGER,
+    has_reviewers INTEGER NOT NULL DEFAULT 0,
+    has_flavors INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    tea TEXT NOT NULL,
+    reviewer TEXT NOT NULL,
+    weight INTEGER,
+    PRIMARY KEY (tea, reviewer)
+);
+CREATE TABLE IF NOT EXISTS flavors (
+    tea TEXT NOT NULL,
+    flavor TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS flavors_tea ON flavors (tea);
+"""
+
+_USER_FIELDS = ('follower_count', 'follower_pgs', 'following_count',
+                'following_pgs')
+_TEA_FIELDS = ('name', 'brand', 'url', 'rating', 'review_pages')
+_TABLES = ('users', 'followers', 'all_urls', 'teas', 'reviews', 'flavors')
+
+
+class ScrapeStore:
+    """
+    Crash-safe SQLite store the scrapers write to as each page is parsed.
+
+    The database runs in WAL mode, so a commit appends the new rows to the
+    write-ahead log instead of rewriting everything, and a crawl that is
+    killed keeps every page committed before it. Rows keep their insertion
+    order, and the load_* methods rebuild the same nested dicts the pickles
+    hold, so UserDict and TeaDict resume from the store as if they had
+    unpickled their last save.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        Database file
+
+    compact_every : int
+        Number of commits between WAL checkpoints
+
+    Methods
+    -------
+    put_user(name, **counts)
+        Add a user or update their follower/following counts.
+
+    add_followers(user, followers, replace=False, done=False)
+        Append a page of followers to a user.
+
+    append_all_urls(names)
+        Append usernames to the all_urls list.
+
+    put_tea(tea_id, **fields)
+        Add a tea or update its name, brand, url, rating or review_pages.
+
+    put_reviews(tea_id, reviews)
+        Add or update (reviewer, weight) reviews of a tea.
+
+    set_flavors(tea_id, flavors)
+        Store a tea's flavor list.
+
+    commit()
+        Make everything written since the last commit durable.
+
+    compact()
+        Fold the WAL back into the database file and reclaim free pages.
+
+    import_dicts(user_dict=None, all_urls=None, tea_dict=None)
+        Replace stored data with existing dicts, e.g. the pickles.
+
+    load_user_dict(), load_all_urls(), load_tea_dict()
+        Rebuild the dicts the scrapers work on.
+
+    """
+
+    def __init__(self, path=os.path.join('..', 'data', 'scrape.sqlite'),
+                 compact_every=1000):
+        """
+        Parameters
+        ----------
+        path : str
+            Database file, created if needed.
+            Default value: '../data/scrape.sqlite'
+
+        compact_every : int
+            Checkpoint the WAL into the database file after this many commits,
+            so the log doesn't grow for the whole crawl. Default value: 1000
+        """
+
+        self.path = path
+        self.compact_every = compact_every
+        self._commits = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL still survives an application crash; only an OS
+        # crash or power loss can drop the last few commits
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    def is_empty(self, table):
+        """True if nothing has been stored in a table yet
+
+        Parameters
+        ----------
+        table : str
+            'users', 'followers', 'all_urls', 'teas', 'reviews' or 'flavors'
+        """
+
+        if table not in _TABLES:
+            raise ValueError(f"Unknown table: {table}")
+        return self.conn.execute(
+            f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None
+
+    def put_user(self, name, **counts):
+        """Add a user or update the given counts (follower_count,
+        follower_pgs, following_count, following_pgs)"""
+        self._upsert('users', 'name', name, _USER_FIELDS, counts)
+
+    def add_followers(self, user, followers, replace=False, done=False):
+        """Append followers to a user's list, in order. The user only gets a
+        'followers' entry in load_user_dict once a call passes done=True, so
+        a user whose pages were cut off by a crash is scraped again.
+
+        Parameters
+        ----------
+        user : str
+
+        followers : list of str
+
+        replace : bool
+            Drop the user's stored followers first. Default value: False
+
+        done : bool
+            Mark the user as having a 'followers' entry, even if the list is
+            empty. Default value: False
+        """
+
+        if replace:
+            self.conn.execute('DELETE FROM followers WHERE user = ?', (user,))
+        self.conn.execute(
+            'INSERT INTO users (name, has_followers) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET '
+            'has_followers = max(has_followers, excluded.has_followers)',
+            (user, int(done)))
+        self.conn.executemany(
+            'INSERT INTO followers (user, follower) VALUES (?, ?)',
+            [(user, follower) for follower in followers])
+
+    def append_all_urls(self, names):
+        self.conn.executemany('INSERT INTO all_urls (name) VALUES (?)',
+                              [(name,) for name in names])
+
+    def put_tea(self, tea_id, **fields):
+        """Add a tea or update the given fields (name, brand, url, rating,
+        review_pages)"""
+        self._upsert('teas', 'id', tea_id, _TEA_FIELDS, fields)
+
+    def put_reviews(self, tea_id, reviews):
+        """Add (reviewer, weight) reviews to a tea. A reviewer who is already
+        stored for the tea keeps their position and gets the new weight, same
+        as assigning to the 'reviewers' dict."""
+        self.conn.execute(
+            'INSERT INTO teas (id, has_reviewers) VALUES (?, 1) '
+            'ON CONFLICT (id) DO UPDATE SET has_reviewers = 1', (tea_id,))
+        self.conn.executemany(
+            'INSERT INTO reviews (tea, reviewer, weight) VALUES (?, ?, ?) '
+            'ON CONFLICT (tea, reviewer) DO UPDATE SET weight = excluded.weight',
+            [(tea_id, reviewer, weight) for reviewer, weight in reviews])
+
+    def set_flavors(self, tea_id, flavors):
+        self.conn.execute('DELETE FROM flavors WHERE tea = ?', (tea_id,))
+        self.conn.execute(
+            'INSERT INTO teas (id, has_flavors) VALUES (?, 1) '
+            'ON CONFLICT (id) DO UPDATE SET has_flavors = 1', (tea_id,))
+        self.conn.executemany('INSERT INTO flavors (tea, flavor) VALUES (?, ?)',
+                              [(tea_id, flavor) for flavor in flavors])
+
+    def _upsert(self, table, key, value, fields, values):
+        unknown = set(values) - set(fields)
+        if unknown:
+            raise ValueError(f"Unknown {table} fields: {sorted(unknown)}")
+        columns = [key] + list(values)
+        placeholders = ', '.join('?' * len(columns))
+        if values:
+            update = ', '.join(f'{c} = excluded.{c}' for c in values)
+            conflict = f'DO UPDATE SET {update}'
+        else:
+            conflict = 'DO NOTHING'
+        self.conn.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) '
+            f'VALUES ({placeholders}) ON CONFLICT ({key}) {conflict}',
+            [value] + list(values.values()))
+
+    def commit(self):
+        """Make everything written since the last commit durable. Every
+        compact_every commits the WAL is also checkpointed."""
+        self.conn.commit()
+        self._commits += 1
+        if self.compact_every and self._commits % self.compact_every == 0:
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def compact(self):
+        """Checkpoint the WAL into the database file and rebuild the file
+        without free pages. Takes time proportional to the whole database, so
+        run it between crawls rather than after every page."""
+        self.conn.commit()
+        self.conn.execute('VACUUM')
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def import_dicts(self, user_dict=None, all_urls=None, tea_dict=None):
+        """Replace the stored users, all_urls and/or teas with existing dicts,
+        e.g. the last pickles, in one transaction
+
+        Parameters
+        ----------
+        user_dict : dict, optional
+
+        all_urls : list, optional
+
+        tea_dict : dict, optional
+        """
+
+        with self.conn:
+            if user_dict is not None:
+                self.conn.execute('DELETE FROM users')
+                self.conn.execute('DELETE FROM followers')
+                for name, user_info in user_dict.items():
+                    self.put_user(name, **{key: user_info[key]
+                                           for key in _USER_FIELDS
+                                           if key in user_info})
+                    if 'followers' in user_info:
+                        self.add_followers(name, user_info['followers'],
+                                           done=True)
+            if all_urls is not None:
+                self.conn.execute('DELETE FROM all_urls')
+                self.append_all_urls(all_urls)
+            if tea_dict is not None:
+                for table in ('teas', 'reviews', 'flavors'):
+                    self.conn.execute(f'DELETE FROM {table}')
+                for tea_id, tea in tea_dict.items():
+                    self.put_tea(tea_id, **{key: tea[key] for key in _TEA_FIELDS
+                                            if key in tea})
+                    if 'reviewers' in tea:
+                        self.put_reviews(tea_id, [
+                            (reviewer, review['weight'])
+                            for reviewer, review in tea['reviewers'].items()])
+                    if 'flavors' in tea:
+                        self.set_flavors(tea_id, tea['flavors'] or [])
+
+    def load_user_dict(self):
+        """Rebuild the user_dict, with users and followers in the order they
+        were stored"""
+        user_dict = {}
+        rows = self.conn.execute(
+            f'SELECT name, {", ".join(_USER_FIELDS)}, has_followers '
+            'FROM users ORDER BY rowid')
+        for name, *counts, has_followers in rows:
+            user_info = {key: count for key, count in zip(_USER_FIELDS, counts)
+                         if count is not None}
+            if has_followers:
+                user_info['followers'] = []
+            user_dict[name] = user_info
+        for user, follower in self.conn.execute(
+                'SELECT f.user, f.follower FROM followers f '
+                'JOIN users u ON u.name = f.user WHERE u.has_followers '
+                'ORDER BY f.rowid'):
+            user_dict[user]['followers'].append(follower)
+        return user_dict
+
+    def load_all_urls(self):
+        return [name for name, in
+                self.conn.execute('SELECT name FROM all_urls ORDER BY rowid')]
+
+    def load_tea_dict(self):
+        """Rebuild the tea_dict, with teas, reviews and flavors in the order
+        they were stored"""
+        tea_dict = {}
+        rows = self.conn.execute(
+            f'SELECT id, {", ".join(_TEA_FIELDS)}, has_reviewers, has_flavors '
+            'FROM teas ORDER BY rowid')
+        for tea_id, *fields, has_reviewers, has_flavors in rows:
+            tea = {key: value for key, value in zip(_TEA_FIELDS, fields)
+                   if value is not None}
+            if has_reviewers:
+                tea['reviewers'] = {}
+            if has_flavors:
+                tea['flavors'] = []
+            tea_dict[tea_id] = tea
+        for tea_id, reviewer, weight in self.conn.execute(
+                'SELECT tea, reviewer, weight FROM reviews ORDER BY rowid'):
+            tea_dict[tea_id]['reviewers'][reviewer] = {'weight': weight}
+        for tea_id, flavor in self.conn.execute(
+                'SELECT tea, flavor FROM flavors ORDER BY rowid'):
+            tea_dict[tea_id]['flavors'].append(flavor)
+        return tea_dict
@@ -9,6 +9,8 @@ import time
 import re
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
+from instrumentation import instrumented, stage
+from records import Reviews, Tea, teas_from_dict, to_plain
 
 
 class TeaDict:
@@ -22,6 +24,12 @@ class TeaDict:
     tea_dict : dict
         Either loads an existing tea dictionary or initializes a new dict.
 
+    url_index : dict
+        Tea ID for each tea URL in the tea_dict
+
+    name_brand_index : dict
+        Tea ID for each (name, brand) pair in the tea_dict
+
     Methods
     -------
     get_teas(tea_pages_to_scrape=1)
@@ -51,44 +59,100 @@ class TeaDict:
     get_flavors(self, num_teas=2):
         Gets flavor list for each tea
     
-    search_url(self, data, url):
-        Look for provided URL among existing tea URLs in the tea_dict
+    find_tea(self, url=None, name=None, brand=None):
+        Look up a tea ID by URL or by name and brand.
+
+    search_url(self, url):
+        Check whether a URL is among existing tea URLs in the tea_dict
 
     add_individual_tea(self,url):
         Add specific tea to tea_dict if it isn't already there.
 
     save_tea_dict(filename='tea_dict',filetype='p'):
         Pickles the tea_dict data for later use.
+
+    load_pickle(self):
+        Load the pickled tea_dict, or start an empty one.
     
     """
 
 
 
-    def __init__(self):
+    def __init__(self, store=None):
         """
         Initializes the TeaDict class with existing data or an empty dictionary
             if no previous data exists.
 
         ...
 
+        Parameters
+        ----------
+        store : ScrapeStore, optional
+            If given, teas, reviews and flavors are committed to the store as
+            each page is parsed, and the tea_dict is loaded from it. An empty
+            store is first filled from the pickle. (default is None)
+
         Attributes
         ----------
         tea_dict : dict
             Either an existing tea dictionary or newly initialized empty dict.
+            Each value is a records.Tea, which reads and writes like the
+            nested dicts in the pickle.
+
+        url_index, name_brand_index : dict
+            Lookups from URL and from (name, brand) to tea ID, kept in sync
+            as teas are added so duplicate checks don't scan the tea_dict.
 
 
         """
+        self.store = store
+
+        if store is not None and not store.is_empty('teas'):
+            with stage('tea_scraper.load_store') as s:
+                self.tea_dict = teas_from_dict(store.load_tea_dict())
+                s.items = len(self.tea_dict)
+            self._build_indexes()
+        else:
+            self.load_pickle()
+            if store is not None:
+                store.import_dicts(tea_dict=self.tea_dict)
+
+        self.driver_options = Options()
+        self.driver_options.headless = True
+
+
+    def load_pickle(self):
+        """Load the pickled tea_dict, or start an empty one"""
         tea_dict_exists = exists('..\\data\\pickled-data\\tea_dict.p')
         if tea_dict_exists == True:
-            with open("..\\data\\pickled-data\\tea_dict.p", 'rb') as p:
-                self.tea_dict = pickle.load(p)
+            with stage('tea_scraper.load_tea_dict') as s:
+                with open("..\\data\\pickled-data\\tea_dict.p", 'rb') as p:
+                    self.tea_dict = teas_from_dict(pickle.load(p))
+                s.items = len(self.tea_dict)
         else:    
             self.tea_dict = {}
+        self._build_indexes()
+
+
+    def _build_indexes(self):
+        self.url_index = {}
+        self.name_brand_index = {}
+        for tea_id in self.tea_dict:
+            self._index_tea(tea_id)
 
-        self.driver_options = Options()
-        self.driver_options.headless = True
 
+    def _index_tea(self, tea_id):
+        # Call after a tea's name, brand or url is set. The first tea stored
+        # under a key keeps it, same as the duplicate checks that skip the rest.
+        tea = self.tea_dict[tea_id]
+        if 'url' in tea:
+            self.url_index.setdefault(_url_key(tea['url']), tea_id)
+        if 'name' in tea and 'brand' in tea:
+            self.name_brand_index.setdefault((tea['name'], tea['brand']),
+                                             tea_id)
 
+
+    @instrumented()
     def get_teas(self, tea_pages_to_scrape=1):
         """Scrapes tea names, brands, and URLs from Steepster tea overview page.
 
@@ -137,6 +201,8 @@ class TeaDict:
 
             tea_root =  driver.find_elements(By.XPATH,tea_xpath)
 
+            page_tea_ids = []
+
             for tea in tea_root:
 
                 tea_id = tea.get_attribute("id")
@@ -145,22 +211,24 @@ class TeaDict:
     
                 nb = tea_details.text.split('\n')
                 name = nb[0]
+                brand = nb[1] if len(nb) > 1 else ''
                 # print(nb)
 
-                # Check if tea is already in tea_dict
-                if name in self.tea_dict.keys():
+                # Check if tea is already in tea_dict, by ID or by name and
+                # brand in case the same tea is listed under another ID
+                if (tea_id in self.tea_dict
+                        or (name, brand) in self.name_brand_index):
                     # print(f'{name} skipped. Already in tea_dict.')
                     pass
                 else:
                     # Add new tea to tea_dict
-                    self.tea_dict[tea_id] = {}
+                    self.tea_dict[tea_id] = Tea()
 
                     # Add tea name to tea entry
                     self.tea_dict[tea_id]['name'] = name
                     # print('name:', name)
 
                     # Add brand to tea entry
-                    brand = nb[1]
                     self.tea_dict[tea_id]['brand'] = brand
                 #     # print('brand:', brand)
 
@@ -177,6 +245,13 @@ class TeaDict:
                     tea_rating = tea.find_element(By.XPATH,tea_rating_xpath)
                     rating = int(tea_rating.text)
                     self.tea_dict[tea_id]['rating'] = rating
+                    self._index_tea(tea_id)
+                    page_tea_ids.append(tea_id)
+
+            if self.store is not None:
+                for tea_id in page_tea_ids:
+                    self.store.put_tea(tea_id, **self.tea_dict[tea_id])
+                self.store.commit()
 
         driver.quit()
 
@@ -202,6 +277,10 @@ class TeaDict:
             for page in max_pages:
                 max_review_pgs = int(page.text)
                 self.tea_dict[tea_id]['review_pages'] = max_review_pgs
+            if self.store is not None and 'review_pages' in self.tea_dict[tea_id]:
+                self.store.put_tea(tea_id,
+                                   review_pages=self.tea_dict[tea_id]['review_pages'])
+                self.store.commit()
             print(f"{self.tea_dict[tea_id]['name']} has {max_review_pgs} review_pages")
 
 
@@ -232,7 +311,9 @@ class TeaDict:
                 print(f'{tea_id} has {review_count} existing reviews.')
         # if the tea has no reviews, create 'reviewers' dictionary
         except:
-            self.tea_dict[tea_id]['reviewers'] = {}
+            self.tea_dict[tea_id]['reviewers'] = Reviews()
+            if self.store is not None:
+                self.store.put_reviews(tea_id, [])
             review_count = 0
             start_page = 1
             print(f'{tea_id} has no existing reviews.')
@@ -240,6 +321,7 @@ class TeaDict:
         return review_count, start_page
 
 
+    @instrumented()
     def get_reviews(self, num_teas=1, review_pgs=1):
         """Gets reviewer names and ratings for each tea.
 
@@ -325,9 +407,12 @@ class TeaDict:
 
                         if len(user_info) == 2:
                             all_user_elements.append(user_info)
-                            self.tea_dict[tea_id]['reviewers'][user_info[0]] = {}
-                            (self.tea_dict[tea_id]['reviewers'][user_info[0]]
-                                ['weight']) = user_info[1]
+                            self.tea_dict[tea_id]['reviewers'][user_info[0]] = {
+                                'weight': user_info[1]}
+
+                    if self.store is not None:
+                        self.store.put_reviews(tea_id, all_user_elements)
+                        self.store.commit()
 
                 new_review_count = len(self.tea_dict[tea_id]['reviewers'].keys())
                 reviews_added = new_review_count - review_count
@@ -356,6 +441,7 @@ class TeaDict:
         return count
 
 
+    @instrumented()
     def get_flavors(self, num_teas=2):
         """Gets flavor list for each tea    
 
@@ -401,12 +487,16 @@ class TeaDict:
                 flavor_str = driver.find_element(By.XPATH,"//dl[@class='tea-description']/dt[text() = 'Flavors']/following-sibling::dd").text
                 flavor_list = flavor_str.split(', ')
                 self.tea_dict[current_tea]['flavors'] = flavor_list
+                if self.store is not None:
+                    self.store.set_flavors(current_tea, flavor_list)
+                    self.store.commit()
 
                 i += 1
 
         driver.quit()
 
 
+    @instrumented()
     def save_tea_dict(self,filename='tea_dict',filetype='p'):
         """Pickle the tea_dict data for later use. Pickled tea - yum...
         
@@ -421,9 +511,10 @@ class TeaDict:
 
         """
         with open(f"..\\data\pickled-data\\{filename}.{filetype}", "wb") as p:
-            pickle.dump(self.tea_dict, p)
+            pickle.dump(to_plain(self.tea_dict), p)
 
 
+    @instrumented()
     def add_individual_tea(self,url):
         """Add specific tea to tea_dict if it isn't already there.
 
@@ -433,7 +524,7 @@ class TeaDict:
         url : str
             URL you would like to check for in the tea_dict
         """
-        already_in_dict_check = self.search_url(data=self.tea_dict,url=url)
+        already_in_dict_check = self.search_url(url)
         
         if already_in_dict_check == True:
             print("This tea is already in the tea dictionary.")
@@ -447,27 +538,47 @@ class TeaDict:
             driver.quit()
 
 
-    def search_url(self, data, url):
-        """Look for provided URL among existing tea URLs in the tea_dict
+    def find_tea(self, url=None, name=None, brand=None):
+        """Look up a tea ID in the URL or (name, brand) index
+
+        Parameters
+        ----------
+
+        url : str, optional
+            Tea page URL. A trailing slash is ignored.
+
+        name, brand : str, optional
+            Tea name and brand, both needed for a name lookup
+
+        Returns
+        -------
+        tea_id : str or None
+            None if no tea matches
+        """
+        if url is not None:
+            tea_id = self.url_index.get(_url_key(url))
+            if tea_id is not None:
+                return tea_id
+        if name is not None and brand is not None:
+            return self.name_brand_index.get((name, brand))
+        return None
+
+
+    def search_url(self, url):
+        """Check whether a URL is among existing tea URLs in the tea_dict
 
         Parameters
         ----------
 
-        data : dict
-            The tea_dict should be provided.
-        
         url : str
             URL you would like to check for in the tea_dict
-        
-        Note: This is a recursive function, so the data parameter will change
-            with each recursion of the function. That's why I added the data
-            parameter instead of just using self.tea_dict.
-        
-        Source: https://stackoverflow.com/questions/50698390
-            /find-a-key-if-a-value-exists-in-a-nested-dictionary
+
+        Returns
+        -------
+        bool
         """
-        for a, b in data.items():
-            if url in str(b):
-                return True
-            if isinstance(b, dict):
-                return self.search_url(b, url)
\ No newline at end of file
+        return self.find_tea(url=url) is not None
+
+
+def _url_key(url):
+    return url.strip().rstrip('/')
@@ -7,6 +7,9 @@ import time
 import re
 import math
 import pickle
+import instrumentation
+from instrumentation import instrumented, stage
+from records import User, to_plain, users_from_dict
 
 
 class UserDict:
@@ -64,41 +67,110 @@ class UserDict:
 
     save_all_the_things(self)
         Helpful utility function to save user_dict and all_urls in one function.
+
+    load_pickles(self)
+        Load the pickled user_dict and all_urls, or start empty ones.
     
     
     """
 
-    def __init__(self):
+    def __init__(self, store=None):
         """
         Initializes the UserDict class with existing data or an empty dictionary
             if no previous data exists.
 
         ...
 
+        Parameters
+        ----------
+        store : ScrapeStore, optional
+            If given, every follower page is committed to the store as soon as
+            it is parsed, so a crawl that gets killed can be resumed without
+            losing work. The user_dict and all_urls are loaded from the store,
+            and an empty store is first filled from the pickles.
+            (default is None)
+
         Attributes
         ----------
         self.user_dict : dict
             Either an existing user dictionary or newly initialized empty dict.
+            Each value is a records.User, which reads and writes like the
+            nested dicts in the pickle.
         
         """
+        self.store = store
+
+        if store is not None and not store.is_empty('users'):
+            with stage('user_scraper.load_store') as s:
+                self.user_dict = users_from_dict(store.load_user_dict())
+                self.all_urls = store.load_all_urls()
+                s.items = len(self.user_dict)
+        else:
+            self.load_pickles()
+            if store is not None:
+                store.import_dicts(user_dict=self.user_dict,
+                                   all_urls=self.all_urls)
+
+        self.driver_options = Options()
+        self.driver_options.headless = True
+
+
+    def load_pickles(self):
+        """Load the pickled user_dict and all_urls, or start empty ones"""
         user_dict_exists = exists('..\\data\\pickled-data\\user_dict.p')
         if user_dict_exists == True:
-            with open("..\\data\\pickled-data\\user_dict.p", 'rb') as p:
-                self.user_dict = pickle.load(p)
+            with stage('user_scraper.load_user_dict') as s:
+                with open("..\\data\\pickled-data\\user_dict.p", 'rb') as p:
+                    self.user_dict = users_from_dict(pickle.load(p))
+                s.items = len(self.user_dict)
         else:    
             self.user_dict = {}
 
         all_urls_exists = exists('..\\data\\pickled-data\\all_urls.p')
         if all_urls_exists == True:
-            with open("..\\data\\pickled-data\\all_urls.p", 'rb') as p:
-                self.all_urls = pickle.load(p)
+            with stage('user_scraper.load_all_urls') as s:
+                with open("..\\data\\pickled-data\\all_urls.p", 'rb') as p:
+                    self.all_urls = pickle.load(p)
+                s.items = len(self.all_urls)
         else:
             self.all_urls = []
 
-        self.driver_options = Options()
-        self.driver_options.headless = True
+
+    def _record_page(self, current_user, page_follower_urls, new_users,
+                     replace=False, done=False):
+        """Commit one parsed follower page to the store, if there is one
+
+        Parameters
+        ----------
+        current_user : str
+            User whose follower page was parsed
+
+        page_follower_urls : list
+            Followers found on the page, appended to current_user's followers
+
+        new_users : list
+            Followers that were added to the user_dict and all_urls
+
+        replace : bool
+            Drop followers stored for current_user by an earlier, unfinished
+            run first. Default value: False
+
+        done : bool
+            current_user now has a 'followers' entry in the user_dict.
+            Default value: False
+        """
+        if self.store is None:
+            return
+        for user in new_users:
+            if user in self.user_dict:
+                self.store.put_user(user, **self.user_dict[user])
+        self.store.add_followers(current_user, page_follower_urls,
+                                 replace=replace, done=done)
+        self.store.append_all_urls(new_users)
+        self.store.commit()
 
     
+    @instrumented()
     def get_first_user(self, username='jack'):
         """
         Adds a specific user to start the self.user_dict. You will probably
@@ -129,7 +201,7 @@ class UserDict:
 
         current_user = username
 
-        self.user_dict = {current_user:{}}
+        self.user_dict = {current_user: User()}
 
         follower_count = int(driver.find_element(By.ID,'follower_count').text)
         max_follower_pg = int(math.ceil(follower_count / 10.0))
@@ -211,7 +283,7 @@ class UserDict:
                 print('First user in zipped_ff_list: ', user)
                 if user in need_followers:
                     print('adding ',user,' to self.user_dict')
-                    self.user_dict[user] = {}
+                    self.user_dict[user] = User()
                     self.user_dict[user]['follower_count'] = user_ff_count
                     max_follower_pg = int(math.ceil(self.user_dict[user]['follower_count'] / 10.0))
                     self.user_dict[user]['follower_pgs'] = max_follower_pg
@@ -227,12 +299,17 @@ class UserDict:
         self.all_urls = follower_urls  # this would overwrite the existing 
         # Now go to the next follower page
 
+        if self.store is not None:
+            self.store.import_dicts(user_dict=self.user_dict,
+                                    all_urls=self.all_urls)
+
         time.sleep(0.5)
 
         # Close browser and terminate driver instance
         driver.quit()
 
 
+    @instrumented()
     def get_users(self, num_users=2, num_follower_pgs=4):
         """
         Add batches of users to an existing user dictionary. The users are
@@ -350,7 +427,7 @@ class UserDict:
                         # print('User in zipped_ff_list: ', user)
                         if user in need_followers:
                             # print('adding ',user,' to user_dict')
-                            self.user_dict[user] = {}
+                            self.user_dict[user] = User()
                             self.user_dict[user]['follower_count'] = user_ff_count
                             max_follower_pg = int(math.ceil(self.user_dict[user]['follower_count'] / 10.0))
                             self.user_dict[user]['follower_pgs'] = max_follower_pg
@@ -359,7 +436,13 @@ class UserDict:
                             # print(user,' is already in user_dict')
                         # time.sleep(3)
 
+                    self._record_page(current_user, page_follower_urls,
+                                      need_followers, replace=(j == 1))
+
                 self.user_dict[current_user]['followers'] = follower_urls
+                # Marks the user as done even if no pages were scraped
+                self._record_page(current_user, [], [],
+                                  replace=not follower_urls, done=True)
 
                 # Increment i to move to next user once browser closes
                 i+=1
@@ -371,6 +454,7 @@ class UserDict:
         driver.quit()
 
     
+    @instrumented()
     def update_users(self,num_users=1,num_follower_pgs=2):
         """
         Get more follower info for users in the user_dict who already have some
@@ -467,7 +551,7 @@ class UserDict:
                         # print('User in zipped_ff_list: ', user)
                         if user in need_followers:
                             # print('adding ',user,' to user_dict')
-                            self.user_dict[user] = {}
+                            self.user_dict[user] = User()
                             self.user_dict[user]['follower_count'] = user_ff_count
                             max_follower_pg = int(math.ceil(self.user_dict[user]['follower_count'] / 10.0))
                             self.user_dict[user]['follower_pgs'] = max_follower_pg
@@ -477,6 +561,8 @@ class UserDict:
                     # add newly scraped users to current user follower list
                     previous_followers = self.user_dict[current_user]['followers']
                     self.user_dict[current_user]['followers'] = (previous_followers + follower_urls)
+                    self._record_page(current_user, follower_urls,
+                                      need_followers, done=True)
 
 
             i += 1
@@ -524,6 +610,7 @@ class UserDict:
         return zero_follower_list
 
 
+    @instrumented()
     def save_user_dict(self,filename='user_dict',filetype='p'):
         """Pickle the user_dict data for later use.
         
@@ -538,9 +625,10 @@ class UserDict:
 
         """
         with open(f"..\\data\pickled-data\\{filename}.{filetype}", "wb") as p:
-            pickle.dump(self.user_dict, p)
+            pickle.dump(to_plain(self.user_dict), p)
     
 
+    @instrumented()
     def save_all_urls(self,filename='all_urls',filetype='p'):
         """Pickle the all_urls list for later use.
         
@@ -566,4 +654,7 @@ class UserDict:
 if __name__ == "__main__":
     all_users = UserDict()
     all_users.get_users(num_users=1, num_follower_pgs=20)
-    all_users.save_all_the_things()
\ No newline at end of file
+    all_users.save_all_the_things()
+
+    if instrumentation.is_enabled():
+        instrumentation.write_log('user_scraper_profile.jsonl')
\ No newline at end of file